@@ -0,0 +1,201 @@
+# aggregate_engine.py
+import re
+import calendar
+from datetime import datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+
+# Deterministic answers for common numeric questions. classify_query() maps a
+# question onto an intent; answer_query() evaluates it with pandas over the
+# typed rows from the transactions collection. Anything that does not match a
+# known intent returns None and goes to ASI as before.
+#
+# Relative periods ("last month", "last 30 days") are anchored on the most
+# recent transaction in the data rather than today's date, because uploaded
+# statements usually describe the past.
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+SPEND_PATTERN = re.compile(r"\b(spen[dt]|spending|expenses?|debit(ed)?|withdr[ae]w\w*|paid|pay)\b")
+# "credit card" is a spend instrument, not income
+INCOME_PATTERN = re.compile(r"\b(earn(ed|ings)?|income|receiv\w*|credit(ed|s)?(?!\s+card)|deposit(ed|s)?|salary)\b")
+TOTAL_PATTERN = re.compile(r"\b(how much|total|sum)\b")
+TOP_PATTERN = re.compile(r"\b(top|largest|biggest|highest|most expensive)\s*(\d+)?\b")
+AVERAGE_BALANCE_PATTERN = re.compile(r"\b(average|avg|mean)\s+(daily\s+)?balance\b")
+BREAKDOWN_PATTERN = re.compile(r"\b(by|per|each)\s+(description|merchant|payee|category|recipient)\b|\bbreak\s*down\b|\bwhere did i spend\b")
+MERCHANT_PATTERN = re.compile(r"\b(?:on|at|to|for|from)\s+([a-z0-9&@._\- ]+?)(?:\s+(?:in|during|over|last|this|since|between)\b|[?.!]|$)")
+
+LAST_N_PATTERN = re.compile(r"\b(?:last|past|previous)\s+(\d+)\s+(day|week|month)s?\b")
+MONTH_NAME_PATTERN = re.compile(r"\b(?:in|during|for)\s+(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b(?:\s+(\d{4}))?")
+YEAR_PATTERN = re.compile(r"\b(?:in|during|for)\s+(\d{4})\b")
+PERIOD_PHRASES = [
+    (re.compile(r"\b(?:last|previous) month\b"), ("relative_month", -1)),
+    (re.compile(r"\bthis month\b"), ("relative_month", 0)),
+    (re.compile(r"\blast week\b"), ("last_n", 1, "week")),
+    (re.compile(r"\bthis week\b"), ("this_week",)),
+    (re.compile(r"\blast year\b"), ("relative_year", -1)),
+    (re.compile(r"\bthis year\b"), ("relative_year", 0)),
+]
+# Time qualifiers left over once the recognised period is removed. Answering
+# such a question as an all-time total would be wrong, so it goes to ASI.
+# "may" is left out as it is more often a verb than a month.
+UNPARSED_TIME_PATTERN = re.compile(
+    r"\b(today|yesterday|tonight|days?|weeks?|weekends?|fortnight|months?|quarters?|quarterly|years?|"
+    r"since|between|until|till|ago|recent(ly)?|(mon|tues|wednes|thurs|fri|satur|sun)day|"
+    + "|".join(name for name in MONTHS if name != "may") + r")\b|\b\d{4}\b|\b\d{1,2}[/-]\d{1,2}\b"
+)
+
+PERIOD_WORDS = {"last month", "this month", "previous month", "last year", "this year", "last week", "this week"}
+
+def parse_period(question: str):
+    # Returns (period, (start, end) of the matched text) or (None, None)
+    match = LAST_N_PATTERN.search(question)
+    if match:
+        return ("last_n", int(match.group(1)), match.group(2)), match.span()
+    match = MONTH_NAME_PATTERN.search(question)
+    if match:
+        return ("month", MONTHS[match.group(1)], int(match.group(2)) if match.group(2) else None), match.span()
+    match = YEAR_PATTERN.search(question)
+    if match:
+        return ("year", int(match.group(1))), match.span()
+    for pattern, period in PERIOD_PHRASES:
+        match = pattern.search(question)
+        if match:
+            return period, match.span()
+    return None, None
+
+def has_unparsed_time(question: str, span) -> bool:
+    if span:
+        question = question[:span[0]] + " " + question[span[1]:]
+    return UNPARSED_TIME_PATTERN.search(question) is not None
+
+def parse_merchant(question: str) -> Optional[str]:
+    match = MERCHANT_PATTERN.search(question)
+    if not match:
+        return None
+    merchant = match.group(1).strip()
+    if not merchant or merchant in PERIOD_WORDS or merchant.split()[0] in ("the", "my", "a", "all", "average"):
+        return None
+    if merchant in MONTHS or merchant.isdigit() or LAST_N_PATTERN.fullmatch(merchant):
+        return None
+    return merchant
+
+def classify_query(question: str):
+    q = question.lower().strip()
+    period, span = parse_period(q)
+    if has_unparsed_time(q, span):
+        return None
+
+    if AVERAGE_BALANCE_PATTERN.search(q):
+        return {"kind": "average_balance", "period": period}
+
+    top = TOP_PATTERN.search(q)
+    if top and (SPEND_PATTERN.search(q) or re.search(r"\btransactions?\b|\bpurchases?\b", q)):
+        return {"kind": "top_debits", "n": int(top.group(2) or 5), "period": period}
+
+    if BREAKDOWN_PATTERN.search(q):
+        return {"kind": "spend_by_description", "period": period}
+
+    if TOTAL_PATTERN.search(q):
+        if SPEND_PATTERN.search(q):
+            return {"kind": "total_spend", "merchant": parse_merchant(q), "period": period}
+        if INCOME_PATTERN.search(q):
+            return {"kind": "total_income", "merchant": parse_merchant(q), "period": period}
+
+    return None
+
+def resolve_period(period, anchor: datetime):
+    # Returns (start, end_exclusive, label) or None for "all time"
+    if period is None:
+        return None
+    kind = period[0]
+    if kind == "last_n":
+        _, n, unit = period
+        days = {"day": 1, "week": 7, "month": 30}[unit] * n
+        end = anchor + timedelta(days=1)
+        return end - timedelta(days=days), end, f"the last {n} {unit}{'s' if n != 1 else ''}"
+    if kind == "relative_month":
+        year, month = anchor.year, anchor.month + period[1]
+        if month < 1:
+            year, month = year - 1, 12
+        return month_range(year, month)
+    if kind == "month":
+        _, month, year = period
+        if year is None:
+            year = anchor.year if month <= anchor.month else anchor.year - 1
+        return month_range(year, month)
+    if kind == "this_week":
+        start = datetime(anchor.year, anchor.month, anchor.day) - timedelta(days=anchor.weekday())
+        return start, start + timedelta(days=7), f"the week of {start:%d %B %Y}"
+    if kind in ("relative_year", "year"):
+        year = anchor.year + period[1] if kind == "relative_year" else period[1]
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1), str(year)
+    return None
+
+def month_range(year: int, month: int):
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end, start.strftime("%B %Y")
+
+def rupees(value: float) -> str:
+    return f"Rs {value:,.2f}"
+
+def answer_query(intent, df: pd.DataFrame) -> Optional[str]:
+    df = df.dropna(subset=["date"])
+    if df.empty:
+        return None
+
+    window = resolve_period(intent.get("period"), df["date"].max())
+    label = "across all your statements"
+    if window:
+        start, end, period_label = window
+        df = df[(df["date"] >= start) & (df["date"] < end)]
+        label = f"in {period_label}"
+    if df.empty:
+        return f"There are no transactions {label}."
+
+    merchant = intent.get("merchant")
+    if merchant:
+        df = df[df["description"].fillna("").str.lower().str.contains(merchant, regex=False)]
+        label = f"on '{merchant}' {label}"
+        # No matching rows usually means the phrase is not a merchant, so let ASI answer
+        if df.empty:
+            return None
+
+    kind = intent["kind"]
+    if kind == "total_spend":
+        debits = df[df["debit"] > 0]
+        return f"You spent {rupees(debits['debit'].sum())} {label} across {len(debits)} debit transaction(s)."
+
+    if kind == "total_income":
+        credits = df[df["credit"] > 0]
+        return f"You received {rupees(credits['credit'].sum())} {label} across {len(credits)} credit transaction(s)."
+
+    if kind == "average_balance":
+        balances = df["balance"].dropna()
+        if balances.empty:
+            return None
+        return f"Your average balance {label} was {rupees(balances.mean())} over {len(balances)} transaction(s)."
+
+    if kind == "top_debits":
+        top = df[df["debit"] > 0].nlargest(intent["n"], "debit")
+        if top.empty:
+            return f"There are no debit transactions {label}."
+        lines = [
+            f"{i}. {row.date:%d-%b-%Y}: {rupees(row.debit)} - {row.description or 'No description'}"
+            for i, row in enumerate(top.itertuples(), start=1)
+        ]
+        return f"Your top {len(top)} debit(s) {label}:\n" + "\n".join(lines)
+
+    if kind == "spend_by_description":
+        debits = df[df["debit"] > 0]
+        if debits.empty:
+            return f"There are no debit transactions {label}."
+        totals = debits.groupby(debits["description"].fillna("No description"))["debit"].agg(["sum", "count"])
+        totals = totals.sort_values("sum", ascending=False).head(10)
+        lines = [f"- {name}: {rupees(row['sum'])} ({int(row['count'])} transaction(s))" for name, row in totals.iterrows()]
+        return f"Spending by description {label}:\n" + "\n".join(lines)
+
+    return None
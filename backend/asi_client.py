@@ -0,0 +1,110 @@
+# asi_client.py
+import os
+import json
+import time
+import aiohttp
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+ASI_API_KEY = os.getenv("ASI_API_KEY")
+
+ASI_URL = os.getenv("ASI_URL", "https://api.asi1.ai/v1/chat/completions")
+ASI_MODEL = "asi1-mini"
+ASI_MAX_CONNECTIONS = int(os.getenv("ASI_MAX_CONNECTIONS", "32"))
+ASI_TIMEOUT = float(os.getenv("ASI_TIMEOUT", "120"))
+
+# One keep-alive connection pool per process. It is created lazily so that it
+# binds to the agent's running event loop rather than the import-time one.
+_session = None
+
+class ASIError(Exception):
+    pass
+
+def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASI_MAX_CONNECTIONS, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=ASI_TIMEOUT)
+        )
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+def request_payload(prompt: str, max_tokens: int, stream: bool):
+    return {
+        "model": ASI_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0,
+        "stream": stream,
+        "max_tokens": max_tokens
+    }
+
+def request_headers(accept: str):
+    return {
+        'Content-Type': 'application/json',
+        'Accept': accept,
+        'Authorization': 'Bearer ' + ASI_API_KEY,
+    }
+
+def count_tokens(usage):
+    if usage:
+        metrics.ASI_TOKENS.inc(usage.get("prompt_tokens", 0), kind="prompt")
+        metrics.ASI_TOKENS.inc(usage.get("completion_tokens", 0), kind="completion")
+
+async def chat_completion(prompt: str, max_tokens: int = 8000) -> str:
+    payload = request_payload(prompt, max_tokens, stream=False)
+    headers = request_headers('application/json')
+
+    with metrics.stage("asi_request"):
+        async with get_session().post(ASI_URL, json=payload, headers=headers) as response:
+            if response.status != 200 or 'application/json' not in response.headers.get('Content-Type', ''):
+                raise ASIError(f"Status Code {response.status}: {await response.text()}")
+            data = await response.json()
+
+    count_tokens(data.get("usage"))
+    if not data.get("choices"):
+        raise ASIError("Response contained no choices")
+    return data["choices"][0]["message"]["content"]
+
+async def stream_chat_completion(prompt: str, max_tokens: int = 8000):
+    # Yields content deltas as ASI sends them (OpenAI-style server-sent events)
+    payload = request_payload(prompt, max_tokens, stream=True)
+    headers = request_headers('text/event-stream')
+
+    started = time.perf_counter()
+    deltas = 0
+    usage = None
+    async with get_session().post(ASI_URL, json=payload, headers=headers) as response:
+        if response.status != 200:
+            raise ASIError(f"Status Code {response.status}: {await response.text()}")
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+            usage = event.get("usage") or usage
+            choices = event.get("choices") or []
+            if choices:
+                token = (choices[0].get("delta") or {}).get("content")
+                if token:
+                    if not deltas:
+                        metrics.record("asi_first_token", time.perf_counter() - started)
+                    deltas += 1
+                    yield token
+
+    metrics.record("asi_stream", time.perf_counter() - started, deltas)
+    # Without a usage block each streamed delta is counted as one token
+    count_tokens(usage or {"completion_tokens": deltas})
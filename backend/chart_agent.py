@@ -1,22 +1,25 @@
 import os
 import time
 import re
-import json
-import requests
-import asyncio
-from typing import Any, Dict
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from typing import Any, Dict, Optional
 from uagents import Agent, Context, Model
 
-# === Load API keys and Mongo URI ===
-load_dotenv()
-api_key = os.getenv("ASI_API_KEY")
-MONGO_URI = os.getenv("MONGODB_URI")
+import asyncio
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import asi_client
+import chart_sandbox
+import metrics
+from db import get_async_client, DB_NAME
+import columnar_store
+import llm_cache
+import rollups
 
-# === MongoDB Setup ===
-client = MongoClient(MONGO_URI)
-db = client['frosthack_db']
+# === MongoDB Setup (async, shared pool) ===
+client = get_async_client()
+db = client[DB_NAME]
 pdf_collection = db['pdf_files']
 json_collection = db['json_files']
 txt_collection = db['txt_files']
@@ -26,27 +29,41 @@ embedding_collection = db['embeddings']
 class Query(Model):
     query: str
     path: str  # path here is just the filename used to look up in MongoDB
+    request_id: str = ""
 
 class QueryResponse(Model):
     timestamp: int
     text: str
     agent_address: str
     answer: str
+    figure: str = ""  # Plotly figure JSON from running the code, empty on failure
+
+class NativeChartRequest(Model):
+    path: str  # TXT filename, as returned by /rest/list_files
+    kind: str  # one of NATIVE_CHARTS
+    request_id: str = ""
+
+class NativeChartResponse(Model):
+    timestamp: int
+    text: str
+    agent_address: str
+    figure: str  # Plotly figure JSON, empty on failure
 
 # === Define Agent ===
 agent = Agent(name="Rest API", seed="chart", port=8003, endpoint=["http://localhost:8003/submit"], mailbox=True)
 
 # === Utility Functions ===
-def get_txt_from_mongodb(filename: str) -> str:
-    doc = txt_collection.find_one({"filename": filename})
+async def get_txt_from_mongodb(filename: str, level: Optional[str] = None):
+    doc = await txt_collection.find_one({"filename": filename})
     if not doc or "content" not in doc:
         raise FileNotFoundError(f"No TXT entry found in MongoDB with filename: {filename}")
-    return doc["content"]
+    if level and doc.get("rollups"):
+        # A rollup is enough context for trend-style charts
+        context = rollups.render({filename: doc["rollups"]}, level)
+        return context, llm_cache.content_hash(context)
+    return doc["content"], doc.get("content_hash") or llm_cache.content_hash(doc["content"])
 
-def query_asi(ctx, context, query):
-    try:
-        url = "https://api.asi1.ai/v1/chat/completions"
-        prompt = f"""
+PROMPT_TEMPLATE = """
         Context: {context}
 
         Question: {query}
@@ -54,59 +71,180 @@ def query_asi(ctx, context, query):
         Instructions: Generate code in python using the library plotly.express as px and the final plot should be stored in variable named fig. Only write the code and nothing else. Give python code only in plain text (not in any other format) with proper indentation that can be run from any other device without any modification. Do not create functions. The last line should be fig = ... and no other line. Always trim arrays to the shortest length before plotting.
         """
 
-        payload = json.dumps({
-            "model": "asi1-mini",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0,
-            "stream": False,
-            "max_tokens": 8000
-        })
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': 'Bearer ' + api_key,
-        }
-
-        response = requests.post(url, headers=headers, data=payload)
+answer_cache = llm_cache.AnswerCache(db[llm_cache.LLM_CACHE_COLLECTION])
 
-        if response.status_code == 200 and 'application/json' in response.headers.get('Content-Type', ''):
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
-        else:
-            raise Exception(f"ASI API failed with status {response.status_code}: {response.text}")
+async def query_asi(ctx, context, context_hash, query, filename):
+    key = llm_cache.make_key(context_hash, PROMPT_TEMPLATE, asi_client.ASI_MODEL, query)
+    cached = await answer_cache.get(key)
+    if cached is not None:
+        ctx.logger.info("♻️ Serving chart code from cache")
+        return cached
 
+    try:
+        answer = await asi_client.chat_completion(PROMPT_TEMPLATE.format(context=context, query=query))
     except Exception as e:
         raise Exception(f"Error during ASI API call: {e}")
 
+    await answer_cache.set(key, answer, [filename])
+    return answer
+
 def extract_python_code(text: str) -> str:
     match = re.search(r"```(?:python)?\s*(.*?)```", text, re.DOTALL)
     return match.group(1).strip() if match else text.strip()
 
+# === Generated Chart Execution ===
+# Generated code runs in chart_sandbox's worker processes. Figures are cached
+# next to the LLM answers by (code hash, data version), so asking for the same
+# chart again neither calls ASI nor re-executes the code, and re-uploading or
+# clearing a statement drops its figures with its answers.
+sandbox = None
+figure_cache = llm_cache.AnswerCache(db[llm_cache.LLM_CACHE_COLLECTION])
+
+async def render_chart_code(ctx, code: str, data_version: str, filename: str) -> str:
+    key = chart_sandbox.figure_key(code, data_version)
+    cached = await figure_cache.get(key)
+    if cached is not None:
+        ctx.logger.info("♻️ Serving chart figure from cache")
+        return cached
+
+    with metrics.stage("chart_code_exec"):
+        figure = await asyncio.to_thread(sandbox.run, code)
+    await figure_cache.set(key, figure, [filename])
+    return figure
+
+# === Native Charts ===
+# The fixed Track Insights charts are plain aggregations over the parsed rows
+# in json_collection, so they are computed directly instead of asking ASI for
+# plotting code.
+def parse_amounts(values: pd.Series) -> pd.Series:
+    cleaned = values.astype(str).str.replace(r"[^0-9.\-]", "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce")
+
+def transactions_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    for column in ("debit", "credit", "balance", "Date"):
+        if column not in df:
+            df[column] = np.nan
+    df["debit"] = parse_amounts(df["debit"]).fillna(0.0)
+    df["credit"] = parse_amounts(df["credit"]).fillna(0.0)
+    df["balance"] = parse_amounts(df["balance"])
+    df["date"] = pd.to_datetime(df["Date"], format="%d-%b-%Y", errors="coerce")
+    return df
+
+def balance_trend_chart(df: pd.DataFrame):
+    trend = df.dropna(subset=["balance"])
+    x = trend["date"] if trend["date"].notna().all() else np.arange(1, len(trend) + 1)
+    return px.line(x=x, y=trend["balance"], labels={"x": "Date", "y": "Balance (Rs)"}, markers=True)
+
+def credit_debit_chart(df: pd.DataFrame):
+    dated = df.dropna(subset=["date"])
+    daily = dated.groupby(dated["date"].dt.date)[["credit", "debit"]].sum().reset_index()
+    daily = daily.rename(columns={"date": "Date", "credit": "Credit", "debit": "Debit"})
+    return px.bar(daily, x="Date", y=["Credit", "Debit"], barmode="group", labels={"value": "Amount (Rs)", "variable": "Type"})
+
+def expense_income_chart(df: pd.DataFrame):
+    totals = pd.DataFrame({"Type": ["Expenses", "Income"], "Amount": [df["debit"].sum(), df["credit"].sum()]})
+    return px.pie(totals, names="Type", values="Amount")
+
+NATIVE_CHARTS = {
+    "balance_trend": balance_trend_chart,
+    "credit_debit": credit_debit_chart,
+    "expense_income": expense_income_chart,
+}
+
+CHART_COLUMNS = ["date", "debit", "credit", "balance"]
+
+def columnar_frame(txt_filename: str):
+    table = columnar_store.load_table([txt_filename], CHART_COLUMNS)
+    if table is None or not table.num_rows:
+        return None
+    return table.to_pandas()
+
+def render_native_chart(df: pd.DataFrame, kind: str) -> str:
+    return NATIVE_CHARTS[kind](df).to_json()
+
+async def get_rows_from_mongodb(txt_filename: str):
+    json_filename = f"{txt_filename.rsplit('.', 1)[0]}.json"
+    doc = await json_collection.find_one({"filename": json_filename}, {"content": 1})
+    if not doc or not doc.get("content"):
+        raise FileNotFoundError(f"No JSON entry found in MongoDB with filename: {json_filename}")
+    return doc["content"]
+
+async def load_chart_frame(txt_filename: str) -> pd.DataFrame:
+    # Typed Parquet columns when available, otherwise parse the raw JSON rows
+    df = await asyncio.to_thread(columnar_frame, txt_filename)
+    if df is not None:
+        return df
+    rows = await get_rows_from_mongodb(txt_filename)
+    return await asyncio.to_thread(transactions_frame, rows)
+
 # === REST Handler ===
+@agent.on_rest_post("/rest/native_chart", NativeChartRequest, NativeChartResponse)
+@metrics.traced("/rest/native_chart")
+async def native_chart(ctx: Context, req: NativeChartRequest) -> NativeChartResponse:
+    ctx.logger.info(f"📊 Building {req.kind} chart for {req.path}")
+
+    try:
+        if req.kind not in NATIVE_CHARTS:
+            raise ValueError(f"Unknown chart kind '{req.kind}'. Expected one of {list(NATIVE_CHARTS)}")
+        df = await load_chart_frame(req.path)
+        with metrics.stage("chart_render") as timer:
+            timer.items = len(df)
+            figure = await asyncio.to_thread(render_native_chart, df, req.kind)
+
+        return NativeChartResponse(
+            text="Successfully built chart.",
+            agent_address=ctx.agent.address,
+            figure=figure,
+            timestamp=int(time.time()),
+        )
+
+    except Exception as e:
+        metrics.mark_error()
+        ctx.logger.error(f"❌ Failed to build chart: {e}")
+        return NativeChartResponse(
+            text=f"Failed to build chart: {e}",
+            agent_address=ctx.agent.address,
+            figure="",
+            timestamp=int(time.time()),
+        )
+
+
 @agent.on_rest_post("/rest/plot_chart", Query, QueryResponse)
+@metrics.traced("/rest/plot_chart")
 async def plot_chart(ctx: Context, req: Query) -> QueryResponse:
     ctx.logger.info(f"📊 Plotting chart for query: {req.query} on file {req.path}")
 
     try:
-        context_data = get_txt_from_mongodb(req.path)
-
-        # Use asyncio executor to run sync ASI query function
-        loop = asyncio.get_running_loop()
-        raw_answer = await loop.run_in_executor(None, query_asi, ctx, context_data, req.query)
+        context_data, context_hash = await get_txt_from_mongodb(req.path, rollups.choose_level(req.query))
+        raw_answer = await query_asi(ctx, context_data, context_hash, req.query, req.path)
 
         answer_code = extract_python_code(raw_answer)
 
         ctx.logger.info("✅ Chart code generated successfully")
 
+        try:
+            figure = await render_chart_code(ctx, answer_code, context_hash, req.path)
+        except chart_sandbox.ChartCodeError as e:
+            metrics.mark_error()
+            ctx.logger.error(f"❌ Chart code failed: {e}")
+            return QueryResponse(
+                text=f"Failed to execute chart code: {e}",
+                agent_address=ctx.agent.address,
+                answer=answer_code,
+                timestamp=int(time.time()),
+            )
+
         return QueryResponse(
-            text="Successfully generated chart code.",
+            text="Successfully generated chart.",
             agent_address=ctx.agent.address,
             answer=answer_code,
+            figure=figure,
             timestamp=int(time.time()),
         )
 
     except Exception as e:
+        metrics.mark_error()
         ctx.logger.error(f"❌ Failed to generate chart: {e}")
         return QueryResponse(
             text=f"Failed to generate chart: {e}",
@@ -115,6 +253,22 @@ async def plot_chart(ctx: Context, req: Query) -> QueryResponse:
             timestamp=int(time.time()),
         )
 
+@agent.on_event("startup")
+async def start_workers(ctx: Context):
+    global sandbox
+    # Workers start and warm up while the agent starts serving
+    sandbox = await asyncio.to_thread(chart_sandbox.SandboxPool)
+    ctx.logger.info(f"Started {sandbox.size} chart worker(s)")
+    port = await metrics.start_http_server(8003)
+    ctx.logger.info(f"Metrics on port {port}")
+
+@agent.on_event("shutdown")
+async def close_connections(ctx: Context):
+    await asi_client.close_session()
+    await metrics.stop_http_servers()
+    if sandbox is not None:
+        sandbox.close()
+
 # === Run the Agent ===
 if __name__ == "__main__":
     agent.run()
@@ -0,0 +1,363 @@
+# chart_sandbox.py
+import os
+import sys
+import ast
+import json
+import queue
+import signal
+import builtins
+import hashlib
+import threading
+import subprocess
+from multiprocessing.connection import Connection
+
+# Chart code written by ASI runs here instead of in the Streamlit process. The
+# code comes from an LLM that statement text can steer, so it is treated as
+# hostile. A fixed pool of worker processes, each a fresh interpreter started
+# with an empty environment and only its two pipe ends open, imports plotly up
+# front and then executes one snippet at a time:
+#   code      - checked before it runs: no names or attributes starting with
+#               "_", no file/module/introspection attributes, imports only
+#               from ALLOWED_MODULES, and builtins without __import__, open,
+#               eval, exec, getattr and friends
+#   process   - when started as root the worker moves into its own network
+#               namespace (no network) and drops to CHART_WORKER_USER; it may
+#               not write files (RLIMIT_FSIZE 0)
+#   CPU time  - RLIMIT_CPU; the worker reports the error and stays usable
+#   memory    - RLIMIT_AS, counted on top of what the worker already maps
+#   wall time - enforced by the parent, which kills the worker and starts a
+#               fresh one (sleeping or blocked code uses no CPU time)
+# Each job returns the figure as Plotly JSON.
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CPU_SECONDS = int(os.getenv("CHART_CPU_SECONDS", "5"))
+CHART_WALL_SECONDS = float(os.getenv("CHART_WALL_SECONDS", "10"))
+CHART_MEMORY_MB = int(os.getenv("CHART_MEMORY_MB", "512"))
+CHART_WORKER_USER = os.getenv("CHART_WORKER_USER", "nobody")
+WORKER_START_TIMEOUT = 60
+# Nothing from the agent's environment (ASI_API_KEY, MONGODB_URI, ...) is passed on
+WORKER_ENV = {"PATH": os.defpath, "LC_ALL": "C.UTF-8"}
+
+class ChartCodeError(Exception):
+    pass
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+def figure_key(code: str, data_version: str) -> str:
+    # A figure depends only on the code and the statement it was written for
+    digest = hashlib.sha256()
+    for part in ("chart_figure", code_hash(code), data_version or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+# --- Code checks ---
+ALLOWED_MODULES = {"plotly", "plotly.express", "plotly.graph_objects", "pandas", "numpy", "datetime", "math"}
+BLOCKED_ATTRIBUTES = {
+    "os", "sys", "io", "builtins", "importlib", "subprocess", "system", "popen", "spawn",
+    "globals", "locals", "vars", "getattr", "setattr", "delattr", "eval", "exec", "compile",
+    "open", "load", "loads", "save", "savez", "savetxt", "loadtxt", "genfromtxt", "fromfile",
+    "tofile", "memmap", "ctypeslib", "f2py", "distutils", "testing", "query", "format",
+    "format_map", "write_image", "write_html", "write_json", "show",
+}
+BLOCKED_PREFIXES = ("_", "read_", "to_csv", "to_pickle", "to_parquet", "to_excel", "to_json",
+                    "to_sql", "to_hdf", "to_feather", "to_html", "to_clipboard", "to_latex")
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs", "all", "any", "bool", "chr", "complex", "dict", "divmod", "enumerate", "filter",
+        "float", "frozenset", "int", "isinstance", "len", "list", "map", "max", "min", "ord",
+        "pow", "print", "range", "repr", "reversed", "round", "set", "slice", "sorted", "str",
+        "sum", "tuple", "zip", "Exception", "ValueError", "TypeError", "KeyError", "IndexError",
+        "ZeroDivisionError",
+    )
+}
+
+def module_name(alias_name: str) -> str:
+    if alias_name not in ALLOWED_MODULES:
+        raise ChartCodeError(f"import of '{alias_name}' is not allowed in chart code")
+    return alias_name
+
+def loaded_module(name: str):
+    # Emitted in place of import statements; the worker imported these already
+    return sys.modules[name]
+
+def module_expr(name: str) -> ast.expr:
+    return ast.Call(func=ast.Name("_module", ast.Load()), args=[ast.Constant(name)], keywords=[])
+
+class SnippetChecker(ast.NodeTransformer):
+    # Rejects anything that reaches past plain data and plotting calls, and
+    # turns allowed imports into lookups of modules the worker already loaded
+    def visit_Name(self, node):
+        if node.id.startswith("_"):
+            raise ChartCodeError(f"name '{node.id}' is not allowed in chart code")
+        return node
+
+    def visit_Attribute(self, node):
+        if node.attr in BLOCKED_ATTRIBUTES or node.attr.startswith(BLOCKED_PREFIXES):
+            raise ChartCodeError(f"attribute '{node.attr}' is not allowed in chart code")
+        return self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        # str.format can walk attributes by name
+        if isinstance(node.value, str) and "__" in node.value:
+            raise ChartCodeError("strings containing '__' are not allowed in chart code")
+        return node
+
+    def visit_Import(self, node):
+        assigns = []
+        for alias in node.names:
+            name = module_name(alias.name)
+            bound = alias.asname or name.split(".")[0]
+            target = name if alias.asname else bound
+            module_name(target)
+            if bound.startswith("_"):
+                raise ChartCodeError(f"name '{bound}' is not allowed in chart code")
+            assigns.append(ast.Assign(targets=[ast.Name(bound, ast.Store())], value=module_expr(target)))
+        return assigns
+
+    def visit_ImportFrom(self, node):
+        name = module_name(node.module or "")
+        assigns = []
+        for alias in node.names:
+            if alias.name == "*" or alias.name.startswith("_") or alias.name in BLOCKED_ATTRIBUTES:
+                raise ChartCodeError(f"'from {name} import {alias.name}' is not allowed in chart code")
+            bound = alias.asname or alias.name
+            if bound.startswith("_"):
+                raise ChartCodeError(f"name '{bound}' is not allowed in chart code")
+            value = ast.Attribute(value=module_expr(name), attr=alias.name, ctx=ast.Load())
+            assigns.append(ast.Assign(targets=[ast.Name(bound, ast.Store())], value=value))
+        return assigns
+
+    def visit_Global(self, node):
+        raise ChartCodeError("global statements are not allowed in chart code")
+
+    visit_Nonlocal = visit_Global
+
+def compile_snippet(code: str):
+    try:
+        tree = ast.parse(code, "<chart>", "exec")
+    except SyntaxError as e:
+        raise ChartCodeError(f"SyntaxError: {e}") from e
+    tree = ast.fix_missing_locations(SnippetChecker().visit(tree))
+    return compile(tree, "<chart>", "exec")
+
+# --- Worker process ---
+class CPUTimeExceeded(BaseException):
+    # BaseException, so a bare `except Exception` in the snippet cannot swallow it
+    pass
+
+def on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded()
+
+def mapped_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+def cpu_seconds_used(resource) -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def isolate_network():
+    # Best effort: a new, empty network namespace needs root (CLONE_NEWNET)
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(0x40000000) != 0:
+        print(f"[WARN] Chart worker could not leave the network namespace (errno {ctypes.get_errno()})", file=sys.stderr)
+
+def drop_privileges(user: str):
+    import pwd
+    try:
+        entry = pwd.getpwnam(user)
+    except KeyError:
+        print(f"[WARN] Chart worker user '{user}' does not exist; keeping root", file=sys.stderr)
+        return
+    os.setgroups([])
+    os.setgid(entry.pw_gid)
+    os.setuid(entry.pw_uid)
+
+def run_snippet(code: str, datetime, px) -> str:
+    namespace = {"__builtins__": SAFE_BUILTINS, "_module": loaded_module, "datetime": datetime, "px": px}
+    exec(compile_snippet(code), namespace)
+    fig = namespace.get("fig")
+    if fig is None:
+        raise ChartCodeError("No figure named 'fig' was created by the chart code")
+    return fig.to_json()
+
+def worker_main(read_fd: int, write_fd: int, cpu_seconds: int, memory_mb: int, user: str):
+    conn_in = Connection(read_fd, writable=False)
+    conn_out = Connection(write_fd, readable=False)
+    if os.geteuid() == 0:
+        isolate_network()
+
+    import datetime
+    import resource
+    import math
+    import numpy
+    import pandas
+    import plotly
+    import plotly.express as px
+    import plotly.graph_objects
+
+    # Build one figure so plotly's templates and validators are loaded before
+    # the first real job
+    px.line(x=[0, 1], y=[0, 1]).to_json()
+
+    if os.geteuid() == 0 and user:
+        drop_privileges(user)
+    os.chdir("/")
+    sys.stdout = open(os.devnull, "w")
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if memory_mb:
+        _, as_hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = mapped_bytes() + memory_mb * 1024 * 1024
+        if as_hard != resource.RLIM_INFINITY:
+            limit = min(limit, as_hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, as_hard))
+    conn_out.send_bytes(json.dumps(["ready", None]).encode("utf-8"))
+
+    while True:
+        try:
+            code = conn_in.recv_bytes().decode("utf-8")
+        except (EOFError, KeyboardInterrupt):
+            return
+        # RLIMIT_CPU counts the whole process, so each job gets a new budget
+        # on top of what earlier jobs used
+        soft = int(cpu_seconds_used(resource)) + cpu_seconds + 1
+        if cpu_hard != resource.RLIM_INFINITY:
+            soft = min(soft, cpu_hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, cpu_hard))
+            result = ["ok", run_snippet(code, datetime, px)]
+        except CPUTimeExceeded:
+            result = ["error", f"chart code used more than {cpu_seconds}s of CPU time"]
+        except ChartCodeError as e:
+            result = ["error", str(e)]
+        except MemoryError:
+            result = ["error", f"chart code used more than {memory_mb} MB of memory"]
+        except Exception as e:
+            result = ["error", f"{type(e).__name__}: {e}"]
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+        conn_out.send_bytes(json.dumps(result).encode("utf-8"))
+
+# --- Pool ---
+class Worker:
+    def __init__(self, cpu_seconds: int, memory_mb: int, user: str):
+        # A fresh interpreter rather than a fork: nothing of the agent (threads,
+        # locks, sockets, Mongo clients, environment) is carried over. Only the
+        # two pipe ends are passed; close_fds closes everything else.
+        child_read, parent_write = os.pipe()
+        parent_read, child_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-E", os.path.abspath(__file__), "--worker",
+                 str(child_read), str(child_write), str(cpu_seconds), str(memory_mb), user or ""],
+                env=WORKER_ENV,
+                cwd="/",
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                close_fds=True,
+                pass_fds=(child_read, child_write),
+                start_new_session=True,
+            )
+        finally:
+            os.close(child_read)
+            os.close(child_write)
+        self.conn_out = Connection(parent_write, readable=False)
+        self.conn_in = Connection(parent_read, writable=False)
+        self.ready = False
+
+    def receive(self):
+        status, payload = json.loads(self.conn_in.recv_bytes().decode("utf-8"))
+        return status, payload
+
+    def wait_ready(self):
+        if self.ready:
+            return
+        if not self.conn_in.poll(WORKER_START_TIMEOUT):
+            raise ChartCodeError("Chart worker did not start")
+        self.receive()
+        self.ready = True
+
+    def run(self, code: str, wall_seconds: float) -> str:
+        self.wait_ready()
+        self.conn_out.send_bytes(code.encode("utf-8"))
+        if not self.conn_in.poll(wall_seconds):
+            raise TimeoutError(f"chart code ran for more than {wall_seconds:g}s")
+        status, payload = self.receive()
+        if status != "ok":
+            raise ChartCodeError(payload)
+        return payload
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self):
+        self.conn_out.close()
+        self.conn_in.close()
+        if self.is_alive():
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+class SandboxPool:
+    def __init__(self, size: int = CHART_WORKERS, cpu_seconds: int = CHART_CPU_SECONDS,
+                 wall_seconds: float = CHART_WALL_SECONDS, memory_mb: int = CHART_MEMORY_MB,
+                 user: str = CHART_WORKER_USER):
+        self.size = max(1, size)
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.user = user
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        for _ in range(self.size):
+            self.idle.put(self.new_worker())
+
+    def new_worker(self) -> Worker:
+        return Worker(self.cpu_seconds, self.memory_mb, self.user)
+
+    def run(self, code: str) -> str:
+        # Blocking; callers on an event loop use asyncio.to_thread
+        if self.closed:
+            raise ChartCodeError("Chart sandbox is closed")
+        # Rejected code never reaches a worker
+        compile_snippet(code)
+        worker = self.idle.get()
+        try:
+            figure = worker.run(code, self.wall_seconds)
+        except ChartCodeError as e:
+            if worker.is_alive():
+                self.idle.put(worker)
+            else:
+                worker.stop()
+                self.idle.put(self.new_worker())
+                raise ChartCodeError(f"Chart worker exited: {e}") from e
+            raise
+        except (TimeoutError, EOFError, OSError, ValueError) as e:
+            # Killed or crashed mid-job: replace it so the pool stays full
+            worker.stop()
+            self.idle.put(self.new_worker())
+            raise ChartCodeError(str(e) or "Chart worker exited") from e
+        self.idle.put(worker)
+        return figure
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            while True:
+                try:
+                    self.idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--worker"]:
+    read_fd, write_fd, cpu_seconds, memory_mb = (int(value) for value in sys.argv[2:6])
+    worker_main(read_fd, write_fd, cpu_seconds, memory_mb, sys.argv[6] if len(sys.argv) > 6 else "")
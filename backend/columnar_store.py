@@ -0,0 +1,102 @@
+# columnar_store.py
+import os
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# A Parquet copy of each statement's transactions with typed columns, written
+# next to the Mongo documents at ingest time. Readers load only the columns
+# they need, memory-mapped, instead of materializing whole JSON documents.
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "columnar"))
+
+SCHEMA = pa.schema([
+    ("file", pa.string()),
+    ("row_index", pa.int32()),
+    ("date", pa.timestamp("ms")),
+    ("description", pa.string()),
+    ("debit", pa.float64()),
+    ("credit", pa.float64()),
+    ("balance", pa.float64()),
+])
+
+def statement_path(source_file: str) -> str:
+    base_filename = os.path.basename(source_file).rsplit(".", 1)[0]
+    return os.path.join(COLUMNAR_DIR, f"{base_filename}.parquet")
+
+def to_float(value) -> Optional[float]:
+    if value is None:
+        return None
+    if hasattr(value, "to_decimal"):
+        value = value.to_decimal()
+    return float(value)
+
+class StatementWriter:
+    # Appends one row group per batch and only replaces the previous file once
+    # the whole statement has been written.
+    def __init__(self, source_file: str):
+        os.makedirs(COLUMNAR_DIR, exist_ok=True)
+        self.path = statement_path(source_file)
+        self.tmp_path = f"{self.path}.part"
+        self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA)
+
+    def write(self, typed_rows):
+        batch = pa.RecordBatch.from_pydict({
+            "file": [row["file"] for row in typed_rows],
+            "row_index": [row["row_index"] for row in typed_rows],
+            "date": [row["date"] for row in typed_rows],
+            "description": [row["description"] for row in typed_rows],
+            "debit": [to_float(row["debit"]) for row in typed_rows],
+            "credit": [to_float(row["credit"]) for row in typed_rows],
+            "balance": [to_float(row["balance"]) for row in typed_rows],
+        }, schema=SCHEMA)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.writer.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+def has_statement(source_file: str) -> bool:
+    return os.path.exists(statement_path(source_file))
+
+def statement_files(files: Optional[list[str]] = None) -> list[str]:
+    if files:
+        paths = [statement_path(f) for f in files]
+        return [p for p in paths if os.path.exists(p)]
+    if not os.path.isdir(COLUMNAR_DIR):
+        return []
+    return sorted(
+        os.path.join(COLUMNAR_DIR, name)
+        for name in os.listdir(COLUMNAR_DIR)
+        if name.endswith(".parquet")
+    )
+
+def iter_tables(files: Optional[list[str]] = None, columns: Optional[list[str]] = None):
+    for path in statement_files(files):
+        yield pq.read_table(path, columns=columns or None, memory_map=True)
+
+def load_table(files: Optional[list[str]] = None, columns: Optional[list[str]] = None) -> Optional[pa.Table]:
+    tables = list(iter_tables(files, columns))
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+def remove_statement(source_file: str):
+    try:
+        os.remove(statement_path(source_file))
+    except OSError:
+        pass
+
+def remove_all():
+    for path in statement_files():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
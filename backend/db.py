@@ -0,0 +1,36 @@
+# db.py
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import metrics
+
+# One blocking and one async Mongo connection pool per process. Agents take
+# their clients from here, so when launcher.py hosts several agents in one
+# process they share these pools instead of opening one each. Clients are
+# created on first use; an agent that only needs one kind never opens the other.
+# Both report every command's latency to metrics.py.
+load_dotenv()
+MONGO_URI = os.getenv("MONGODB_URI")
+DB_NAME = "frosthack_db"
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+def get_client() -> MongoClient:
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(MONGO_URI, event_listeners=[metrics.mongo_listener])
+    return _client
+
+def get_async_client() -> AsyncIOMotorClient:
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncIOMotorClient(MONGO_URI, event_listeners=[metrics.mongo_listener])
+    return _async_client
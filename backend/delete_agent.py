@@ -1,25 +1,34 @@
 import os
 import time
+import asyncio
 import traceback
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import requests
 from uagents import Agent, Context, Model
 
-# === Load environment variables from .env ===
-load_dotenv()
-MONGO_URI = os.getenv("MONGODB_URI")
+import columnar_store
+import metrics
+from db import get_async_client, DB_NAME
 
-# === MongoDB Setup ===
-client = MongoClient(MONGO_URI)
-db = client['frosthack_db']
+# === MongoDB Setup (async, shared pool) ===
+client = get_async_client()
+db = client[DB_NAME]
 pdf_collection = db['pdf_files']
 json_collection = db['json_files']
 txt_collection = db['txt_files']
 embedding_collection = db['embeddings']
+chunk_collection = db['embedding_chunks']
+llm_cache_collection = db['llm_cache']
+transaction_collection = db['transactions']
+
+EMBEDDING_REMOVE_URL = "http://localhost:8002/rest/remove_files"
 
 # === Agent Models ===
 class DeleteRequest(Model):
-    pass
+    request_id: str = ""
+
+class DeleteFileRequest(Model):
+    filename: str  # any of the statement's names, e.g. the TXT from /rest/list_files
+    request_id: str = ""
 
 class DeleteResponse(Model):
     timestamp: int
@@ -32,12 +41,22 @@ delete_agent = Agent(name="Delete Agent", seed="delete", port=8005, endpoint=["h
 
 # === Endpoint to Clear All Collections ===
 @delete_agent.on_rest_post("/rest/clear_all_data", DeleteRequest, DeleteResponse)
+@metrics.traced("/rest/clear_all_data")
 async def clear_all_data(ctx: Context, _: DeleteRequest) -> DeleteResponse:
     try:
-        pdf_result = pdf_collection.delete_many({})
-        json_result = json_collection.delete_many({})
-        txt_result = txt_collection.delete_many({})
-        embedding_result = embedding_collection.delete_many({})
+        pdf_result, json_result, txt_result, embedding_result, *_ = await asyncio.gather(
+            pdf_collection.delete_many({}),
+            json_collection.delete_many({}),
+            txt_collection.delete_many({}),
+            embedding_collection.delete_many({}),
+            chunk_collection.delete_many({}),
+            llm_cache_collection.delete_many({}),
+            transaction_collection.delete_many({}),
+            db['faiss_index.files'].delete_many({}),
+            db['faiss_index.chunks'].delete_many({})
+        )
+
+        columnar_store.remove_all()
 
         ctx.logger.info(f"✅ Cleared collections — PDFs: {pdf_result.deleted_count}, JSONs: {json_result.deleted_count}, TXTs: {txt_result.deleted_count}, Embeddings: {embedding_result.deleted_count}")
 
@@ -48,6 +67,7 @@ async def clear_all_data(ctx: Context, _: DeleteRequest) -> DeleteResponse:
             message="All documents and embeddings have been cleared from the database."
         )
     except Exception as e:
+        metrics.mark_error()
         err_msg = traceback.format_exc()
         ctx.logger.error(f"❌ Exception during deletion:\n{err_msg}")
         return DeleteResponse(
@@ -57,6 +77,73 @@ async def clear_all_data(ctx: Context, _: DeleteRequest) -> DeleteResponse:
             message=str(e) or "Unknown error occurred"
         )
 
+@delete_agent.on_event("startup")
+async def start_metrics(ctx: Context):
+    port = await metrics.start_http_server(8005)
+    ctx.logger.info(f"Metrics on port {port}")
+
+@delete_agent.on_event("shutdown")
+async def stop_metrics(ctx: Context):
+    await metrics.stop_http_servers()
+
+# === Endpoint to Delete a Single Statement ===
+def remove_vectors(txt_filename: str):
+    # The embedding agent owns the live index; it also drops files whose TXT
+    # is gone on its next startup sync, so a missed call is not fatal
+    try:
+        response = requests.post(
+            EMBEDDING_REMOVE_URL,
+            json={"filenames": [txt_filename], "request_id": metrics.current_request_id()},
+            timeout=120
+        )
+        return response.json().get("chunks", 0)
+    except Exception as e:
+        print(f"[WARN] Could not reach embedding agent for {txt_filename}: {e}")
+        return None
+
+@delete_agent.on_rest_post("/rest/delete_file", DeleteFileRequest, DeleteResponse)
+@metrics.traced("/rest/delete_file")
+async def delete_file(ctx: Context, req: DeleteFileRequest) -> DeleteResponse:
+    base_filename = os.path.basename(req.filename).rsplit(".", 1)[0]
+    pdf_filename, txt_filename = f"{base_filename}.pdf", f"{base_filename}.txt"
+    try:
+        # Take it out of search first, then drop the stored documents
+        vectors = await asyncio.to_thread(remove_vectors, txt_filename)
+        pdf_result, json_result, txt_result, transaction_result, _ = await asyncio.gather(
+            pdf_collection.delete_many({"filename": pdf_filename}),
+            json_collection.delete_many({"filename": f"{base_filename}.json"}),
+            txt_collection.delete_many({"filename": txt_filename}),
+            transaction_collection.delete_many({"file": pdf_filename}),
+            llm_cache_collection.delete_many({"files": txt_filename})
+        )
+        await asyncio.to_thread(columnar_store.remove_statement, pdf_filename)
+
+        if not (pdf_result.deleted_count or json_result.deleted_count or txt_result.deleted_count):
+            return DeleteResponse(
+                timestamp=int(time.time()),
+                agent_address=ctx.agent.address,
+                status="not_found",
+                message=f"No statement named {base_filename} was found."
+            )
+
+        ctx.logger.info(f"✅ Deleted {base_filename} — Transactions: {transaction_result.deleted_count}, Vectors: {vectors}")
+        return DeleteResponse(
+            timestamp=int(time.time()),
+            agent_address=ctx.agent.address,
+            status="success",
+            message=f"Deleted {base_filename} and its {transaction_result.deleted_count} transactions."
+        )
+    except Exception as e:
+        metrics.mark_error()
+        err_msg = traceback.format_exc()
+        ctx.logger.error(f"❌ Exception during deletion of {base_filename}:\n{err_msg}")
+        return DeleteResponse(
+            timestamp=int(time.time()),
+            agent_address=ctx.agent.address,
+            status="error",
+            message=str(e) or "Unknown error occurred"
+        )
+
 # === Run the Agent ===
 if __name__ == "__main__":
     delete_agent.run()
@@ -1,130 +1,582 @@
 # embedding_agent.py
 import os
 import time
+import asyncio
+import hashlib
+import re
+import argparse
+import threading
 import faiss
 import numpy as np
 from typing import Optional
 
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import gridfs
+from pymongo import ReturnDocument
 
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import CharacterTextSplitter
 from uagents import Agent, Context, Model
 
-# --- MongoDB Initialization (from db.py) ---
-# Load environment variables from .env
-load_dotenv()
-MONGO_URI = os.getenv("MONGODB_URI")
+import metrics
+import vector_backends
+from db import get_client, get_async_client, DB_NAME
 
-# Create client and select DB
-client = MongoClient(MONGO_URI)
-db = client['frosthack_db']  # Use your preferred database name
+# --- MongoDB Initialization (shared pools from db.py) ---
+client = get_client()
+db = client[DB_NAME]
 
 # Define collections
 pdf_collection = db['pdf_files']
 json_collection = db['json_files']
 txt_collection = db['txt_files']
 embedding_collection = db['embeddings']
+chunk_collection = db['embedding_chunks']
+index_bucket = gridfs.GridFSBucket(db, bucket_name="faiss_index")
+
+# Async handle for lookups made directly on the event loop; index maintenance
+# runs in worker threads and keeps using the blocking client above.
+async_client = get_async_client()
+async_txt_collection = async_client[DB_NAME]['txt_files']
 # -------------------------------------------
 
 # Initialize Agent
 class Query(Model):
     query: str
+    top_k: int = 5
+    request_id: str = ""
+
+class ChunkResult(Model):
+    filename: str
+    text: str
+    score: float
 
 class PathResponse(Model):
     timestamp: int
     text: str
     agent_address: str
     path: Optional[str] = None
+    chunks: list[ChunkResult] = []
 
 class DummyRequest(Model):
-    pass
+    request_id: str = ""
 
 class FileListResponse(Model):
     files: list[str]
 
+class IndexRequest(Model):
+    filenames: list[str]
+    request_id: str = ""
+
+class IndexResponse(Model):
+    timestamp: int
+    text: str
+    agent_address: str
+    chunks: int = 0
+
 agent = Agent(name="Rest API", seed="embed", port=8002, endpoint=["http://localhost:8002/submit"], mailbox=True)
 
-# Embedding model and splitter
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-splitter = CharacterTextSplitter()
+# Embedding model and splitter. The model (EMBEDDING_BACKEND, see
+# vector_backends.py) is loaded on first use or in the background at startup,
+# so the agent can serve requests that do not need it.
+embeddings = None
+embeddings_lock = threading.Lock()
+model_ready = threading.Event()
+warm_up_task = None
+
+def get_embeddings():
+    global embeddings
+    with embeddings_lock:
+        if embeddings is None:
+            model = vector_backends.load_encoder()
+            # The first encode pays for tokenizer and kernel setup
+            model.embed_query("warm up")
+            embeddings = model
+            model_ready.set()
+    return embeddings
+
+# Narrations hold one transaction per line, so chunks are small groups of
+# whole transactions rather than entire statements.
+CHUNK_SIZE = 600
+splitter = CharacterTextSplitter(separator="\n", chunk_size=CHUNK_SIZE, chunk_overlap=0)
+# Bumped whenever chunking changes; an index built with another format is
+# re-embedded on startup. Format 1 embedded each statement as a single chunk,
+# format 2 split on every newline, including those inside descriptions.
+CHUNK_FORMAT = 3
+SENTENCE_BREAK = re.compile(r"(?<= Rs\.) (?=On [^,]+, a transaction took place|The final balance at the end)")
+
+def split_narration(narration: str):
+    # One line per transaction, whatever line breaks the stored narration has:
+    # older ones are a single line, and newer ones may break inside a description
+    narration = SENTENCE_BREAK.sub("\n", " ".join(narration.split()))
+    return splitter.split_text(narration)
 
 def preprocess_text(text: str) -> str:
     return text.lower().replace("\n", " ").strip()
 
+# --- Index record and stable vector IDs ---
+# Each file owns a fixed block of 2**24 vector IDs derived from its filename,
+# so re-indexing or removing one file never renumbers the others.
+INDEX_RECORD_ID = "faiss_index"
+CHUNK_ID_BITS = 24
+
+def file_id_range(filename: str):
+    file_key = int.from_bytes(hashlib.sha1(filename.encode("utf-8")).digest()[:5], "big") >> 1
+    start = file_key << CHUNK_ID_BITS
+    return start, start + (1 << CHUNK_ID_BITS)
+
+def vector_ids(filename: str, count: int) -> np.ndarray:
+    start, _ = file_id_range(filename)
+    return np.arange(start, start + count, dtype="int64")
+
+def file_key(vector_id: int) -> int:
+    return int(vector_id) >> CHUNK_ID_BITS
+
+# --- Resident index cache ---
+# The deserialized index stays in memory between searches. Mongo is only asked
+# for the generation counter every INDEX_CHECK_INTERVAL seconds, to notice
+# changes made by other processes (e.g. the delete agent clearing everything).
+# Writers never mutate the cached index in place: they clone it, modify the
+# clone and swap it in, so concurrent searches always see a consistent index.
+#
+# Removing a file only takes it out of the file list and records it under
+# "removed" with a new "revision"; searches exclude the ID ranges of removed
+# files.
+# Its vectors stay in the index as tombstones until the next index write, or
+# compact_index() once they make up INDEX_COMPACT_RATIO of the index.
+INDEX_CHECK_INTERVAL = 5.0
+INDEX_COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.2"))
+
+class IndexCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.index = None
+        self.files = []
+        self.file_lookup = {}
+        self.generation = None
+        self.removed = []
+        self.revision = None
+        self.checked_at = 0.0
+
+    def set(self, index, files, generation, removed=None, revision=None):
+        if index is not None:
+            vector_backends.configure_search(index)
+        file_lookup = {file_key(file_id_range(f["filename"])[0]): f["filename"] for f in files}
+        with self._lock:
+            self.index = index
+            self.files = files
+            self.file_lookup = file_lookup
+            self.generation = generation
+            self.removed = removed or []
+            self.revision = revision
+            self.checked_at = time.monotonic()
+
+    def _current(self):
+        with self._lock:
+            return self.index, self.files, self.file_lookup
+
+    def _is_stale(self):
+        return time.monotonic() - self.checked_at > INDEX_CHECK_INTERVAL
+
+    def snapshot(self):
+        if self._is_stale():
+            with self._refresh_lock:
+                if self._is_stale():
+                    self.refresh()
+        return self._current()
+
+    def refresh(self):
+        meta = embedding_collection.find_one({"_id": INDEX_RECORD_ID}, {"generation": 1, "gridfs_id": 1, "revision": 1})
+        if not meta or "gridfs_id" not in meta:
+            self.set(None, [], None)
+        elif meta.get("generation") != self.generation:
+            record = load_index_record()
+            index = read_index_file(fetch_index_file(record))
+            self.set(index, record.get("files", []), record.get("generation"), record.get("removed"), record.get("revision"))
+            print(f"[INFO] Loaded index generation {record.get('generation')} ({index.ntotal} vectors).")
+        elif meta.get("revision") != self.revision:
+            # Files were removed without rewriting the index
+            record = load_index_record()
+            index, _, _ = self._current()
+            self.set(index, record.get("files", []), self.generation, record.get("removed"), record.get("revision"))
+        else:
+            with self._lock:
+                self.checked_at = time.monotonic()
+
+# --- Index storage ---
+# The serialized index lives in GridFS (chunked, so it is not bound by the
+# 16 MB document limit) and each process keeps a local copy on disk that FAISS
+# memory-maps instead of reading the whole blob into RAM. The record in
+# embedding_collection only holds metadata and the GridFS file id.
+INDEX_DIR = os.getenv("FAISS_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_cache"))
+# Only flat indexes are memory-mapped; IVF lists must stay writable for clones
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) if vector_backends.INDEX_TYPE == "flat" else 0
+
+def local_index_path(generation: int) -> str:
+    return os.path.join(INDEX_DIR, f"faiss_{generation}.index")
+
+def read_index_file(path: str):
+    return faiss.read_index(path, MMAP_FLAGS)
+
+def fetch_index_file(record) -> str:
+    path = local_index_path(record["generation"])
+    if not os.path.exists(path):
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            index_bucket.download_to_stream(record["gridfs_id"], f)
+        os.replace(tmp_path, path)
+    prune_local_index_files(keep=path)
+    return path
+
+def prune_local_index_files(keep: str):
+    for name in os.listdir(INDEX_DIR):
+        path = os.path.join(INDEX_DIR, name)
+        if path != keep and name.startswith("faiss_"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+index_cache = IndexCache()
+index_write_lock = threading.Lock()
+
+def load_index_record():
+    return embedding_collection.find_one({"_id": INDEX_RECORD_ID})
+
+def load_index():
+    # Returns a private copy of the live index that callers may modify
+    index, files, _ = index_cache.snapshot()
+    if index is None:
+        return None, []
+    return faiss.clone_index(index), list(files)
+
+def store_index(index, files):
+    generation = (index_cache.generation or 0) + 1
+    path = local_index_path(generation)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with metrics.stage("index_store") as timer:
+        timer.items = index.ntotal
+        faiss.write_index(index, path)
+        with open(path, "rb") as f:
+            gridfs_id = index_bucket.upload_from_stream(os.path.basename(path), f)
+
+    previous = embedding_collection.find_one_and_replace(
+        {"_id": INDEX_RECORD_ID},
+        {
+            "_id": INDEX_RECORD_ID,
+            "gridfs_id": gridfs_id,
+            "files": files,
+            "ntotal": index.ntotal,
+            "encoder": vector_backends.ENCODER_NAME,
+            "chunk_format": CHUNK_FORMAT,
+            "index_type": vector_backends.index_kind(index),
+            "generation": generation
+        },
+        upsert=True
+    )
+    if previous and previous.get("gridfs_id"):
+        index_bucket.delete(previous["gridfs_id"])
+
+    # Serve searches from the memory-mapped file rather than the writer's copy
+    index_cache.set(read_index_file(path), files, generation)
+    prune_local_index_files(keep=path)
+
+def embed_chunks(narration: str):
+    with metrics.stage("chunking") as timer:
+        chunks = [preprocess_text(chunk) for chunk in split_narration(narration)]
+        timer.items = len(chunks)
+    if not chunks:
+        return [], None
+    with metrics.stage("embedding") as timer:
+        timer.items = len(chunks)
+        vectors = np.array(get_embeddings().embed_documents(chunks), dtype="float32")
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return chunks, vectors
+
+# --- Incremental ingestion ---
+def file_version(doc):
+    # The narration hash identifies a file's content; older documents without
+    # one fall back to their upload time.
+    return doc.get("content_hash") or doc.get("upload_time")
+
+def add_file_to_index(index, files, doc, kind: str = vector_backends.INDEX_TYPE):
+    filename = doc["filename"]
+    start, end = file_id_range(filename)
+
+    # Drop any vectors left over from a previous upload of the same file
+    if index is not None:
+        index = vector_backends.remove_range(index, start, end)
+    chunk_collection.delete_many({"filename": filename})
+    files = [f for f in files if f["filename"] != filename]
+
+    chunks, vectors = embed_chunks(doc["content"])
+    if not chunks:
+        print(f"[WARN] No chunks produced for {filename}.")
+        return index, files, 0
+
+    ids = vector_ids(filename, len(chunks))
+    index = vector_backends.add_vectors(index, ids, vectors, kind)
+
+    chunk_collection.insert_many([
+        {"_id": int(vid), "filename": filename, "chunk_index": i, "text": chunk}
+        for i, (vid, chunk) in enumerate(zip(ids, chunks))
+    ])
+    files.append({
+        "filename": filename,
+        "upload_time": doc.get("upload_time"),
+        "version": file_version(doc),
+        "chunks": len(chunks)
+    })
+    return index, files, len(chunks)
+
+def index_files(filenames):
+    added = 0
+    changed = False
+    with index_write_lock:
+        index, files = load_index()
+        if index is not None and index_cache.removed:
+            # The index is rewritten anyway, so drop tombstones now; before
+            # adding, in case a removed file is being uploaded again
+            index = drop_removed(index, index_cache.removed)
+            changed = True
+        indexed = {f["filename"]: f.get("version") for f in files}
+        for filename in filenames:
+            doc = txt_collection.find_one({"filename": filename})
+            if not doc or not doc.get("content"):
+                print(f"[WARN] Skipping {filename}: no text content in MongoDB.")
+                continue
+            if index is not None and indexed.get(filename) == file_version(doc):
+                print(f"[INFO] {filename} is unchanged; keeping its existing vectors.")
+                continue
+            index, files, count = add_file_to_index(index, files, doc)
+            added += count
+            changed = True
+
+        if index is not None and changed:
+            # Switches a flat start-up index to the configured type once it
+            # has enough vectors to train on
+            index = vector_backends.convert(index)
+            store_index(index, files)
+    print(f"[INFO] Indexed {added} chunks from {len(filenames)} file(s).")
+    return added
+
+# --- Removal and compaction ---
+def tombstoned_vectors(removed) -> int:
+    return sum(entry.get("chunks", 0) for entry in removed)
+
+def drop_removed(index, removed):
+    return vector_backends.remove_ranges(index, [file_id_range(entry["filename"]) for entry in removed])
+
+def remove_files(filenames):
+    # Takes files out of search without touching the stored index; returns
+    # the number of vectors that became tombstones
+    targets = set(filenames)
+    with index_write_lock:
+        chunk_collection.delete_many({"filename": {"$in": list(targets)}})
+        index, files, _ = index_cache.snapshot()
+        gone = [f for f in files if f["filename"] in targets]
+        if index is None or not gone:
+            return 0
+        files = [f for f in files if f["filename"] not in targets]
+        removed = index_cache.removed + [{"filename": f["filename"], "chunks": f.get("chunks", 0)} for f in gone]
+        record = embedding_collection.find_one_and_update(
+            {"_id": INDEX_RECORD_ID},
+            {"$set": {"files": files, "removed": removed}, "$inc": {"revision": 1}},
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        index_cache.set(index, files, index_cache.generation, removed, (record or {}).get("revision"))
+    count = tombstoned_vectors(removed[-len(gone):])
+    print(f"[INFO] Removed {len(gone)} file(s) ({count} vectors) from search.")
+    return count
+
+def needs_compaction() -> bool:
+    index, _, _ = index_cache.snapshot()
+    removed = index_cache.removed
+    return index is not None and bool(removed) and tombstoned_vectors(removed) >= INDEX_COMPACT_RATIO * index.ntotal
+
+def compact_index():
+    # Rewrites the index without tombstoned vectors; nothing is re-embedded
+    with index_write_lock:
+        index, files = load_index()
+        removed = index_cache.removed
+        if index is None or not removed:
+            return 0
+        before = index.ntotal
+        with metrics.stage("index_compact") as timer:
+            index = drop_removed(index, removed)
+            timer.items = before - index.ntotal
+            store_index(index, files)
+    print(f"[INFO] Compacted index: dropped {before - index.ntotal} vectors, {index.ntotal} remain.")
+    return before - index.ntotal
+
+def sync_embeddings():
+    # Embed only files that are new or were re-uploaded since they were indexed
+    index, files, _ = index_cache.snapshot()
+    if index is None:
+        # Drop records written by older single-document layouts
+        embedding_collection.delete_many({})
+    else:
+        # Vectors from a different encoder or chunk format are not comparable; re-embed all
+        record = embedding_collection.find_one({"_id": INDEX_RECORD_ID}, {"encoder": 1, "chunk_format": 1}) or {}
+        encoder = record.get("encoder", "mpnet")
+        if encoder != vector_backends.ENCODER_NAME:
+            print(f"[INFO] Index was built with '{encoder}', re-embedding with '{vector_backends.ENCODER_NAME}'.")
+            return load_and_store_embeddings()
+        chunk_format = record.get("chunk_format", 1)
+        if chunk_format != CHUNK_FORMAT:
+            print(f"[INFO] Index uses chunk format {chunk_format}, re-embedding with format {CHUNK_FORMAT}.")
+            return load_and_store_embeddings()
+    indexed = {f["filename"]: f.get("version") for f in files}
+    docs = [doc for doc in txt_collection.find({}, {"filename": 1, "upload_time": 1, "content_hash": 1}) if doc.get("filename")]
+    stale = [doc["filename"] for doc in docs if indexed.get(doc["filename"], -1) != file_version(doc)]
+    # Files deleted while this agent was unreachable
+    deleted = set(indexed) - {doc["filename"] for doc in docs}
+    if deleted:
+        remove_files(deleted)
+    if stale:
+        index_files(stale)
+    elif needs_compaction():
+        compact_index()
+    return stale
+
 def load_and_store_embeddings():
+    # Full rebuild: only run when explicitly requested or the encoder or chunk format changed
     if txt_collection.count_documents({}) == 0:
         print("No text documents found in MongoDB.")
         return
 
-    txt_docs = txt_collection.find()
-    text_chunks = []
-    chunk_map = []
-
-    for doc in txt_docs:
-        narration = doc.get("content")
-        filename = doc.get("filename")
-
-        if not narration or not filename:
-            print(f"[WARN] Skipping document due to missing fields: {doc}")
-            continue
-
-        chunks = splitter.split_text(narration)
-        chunks = [preprocess_text(chunk) for chunk in chunks]
-        text_chunks.extend(chunks)
-        chunk_map.extend([filename] * len(chunks))
-
-    if not text_chunks:
-        print("[WARN] No valid chunks found.")
-        return []
-
-    embeddings_array = np.array(embeddings.embed_documents(text_chunks))
-    embeddings_array = embeddings_array / np.linalg.norm(embeddings_array, axis=1, keepdims=True)
-
-    index = faiss.IndexFlatIP(embeddings_array.shape[1])
-    index.add(embeddings_array)
-
-    index_data = faiss.serialize_index(index)
-
-    embedding_collection.delete_many({})
-    embedding_collection.insert_one({
-        "index": index_data.tobytes(),
-        "chunk_map": chunk_map
-    })
-
-    print(f"[INFO] Stored {len(chunk_map)} chunks in MongoDB.")
-    return chunk_map
-
-def search_documents(query: str, top_k: int = 1):
-    record = embedding_collection.find_one()
-    if not record:
-        print("[WARN] No embeddings found. Rebuilding...")
-        load_and_store_embeddings()
-        record = embedding_collection.find_one()
-        if not record:
+    index = None
+    files = []
+    with index_write_lock:
+        chunk_collection.delete_many({})
+        for doc in txt_collection.find():
+            if not doc.get("content") or not doc.get("filename"):
+                print(f"[WARN] Skipping document due to missing fields: {doc.get('_id')}")
+                continue
+            # Collect exact vectors first so trained index types see the whole corpus
+            index, files, _ = add_file_to_index(index, files, doc, kind="flat")
+
+        if index is None:
+            print("[WARN] No valid chunks found.")
+            return []
+        index = vector_backends.convert(index, force=True)
+
+        embedding_collection.delete_many({})
+        for stale in index_bucket.find():
+            index_bucket.delete(stale._id)
+        store_index(index, files)
+
+    print(f"[INFO] Stored {index.ntotal} chunks in GridFS.")
+    return [f["filename"] for f in files]
+
+def search_documents_batch(queries: list[str], top_k: int = 1):
+    index, _, file_lookup = index_cache.snapshot()
+    if index is None:
+        print("[WARN] No embeddings found. Indexing stored files...")
+        sync_embeddings()
+        index, _, file_lookup = index_cache.snapshot()
+        if index is None:
             print("[ERROR] Still no embeddings found.")
-            return None
-
-    index_data = record["index"]
-    chunk_map = record["chunk_map"]
-
-    index = faiss.deserialize_index(np.frombuffer(index_data, dtype=np.uint8))
-
-    query_vec = np.array([embeddings.embed_query(preprocess_text(query))])
-    query_vec = query_vec / np.linalg.norm(query_vec)
+            return [[] for _ in queries]
+
+    # One forward pass and one index.search over the whole batch
+    with metrics.stage("query_encode") as timer:
+        timer.items = len(queries)
+        query_vecs = np.array(get_embeddings().embed_documents([preprocess_text(q) for q in queries]), dtype="float32")
+    query_vecs = query_vecs / np.linalg.norm(query_vecs, axis=1, keepdims=True)
+
+    # Tombstoned files are excluded inside the search: their chunks cluster
+    # together, so filtering afterwards could drop every hit near them
+    removed_ranges = [file_id_range(entry["filename"]) for entry in index_cache.removed]
+    with metrics.stage("faiss_search") as timer:
+        timer.items = len(queries)
+        distances, indices = vector_backends.search(index, query_vecs, max(top_k, 1), removed_ranges)
+
+    results = [
+        [
+            {"id": int(i), "filename": file_lookup[file_key(i)], "score": float(distances[row][j])}
+            for j, i in enumerate(indices[row])
+            if i != -1 and file_key(i) in file_lookup
+        ][:top_k]
+        for row in range(len(queries))
+    ]
+
+    # Fetch the chunk texts for the whole batch in a single round-trip
+    ids = [hit["id"] for hits in results for hit in hits]
+    texts = {c["_id"]: c["text"] for c in chunk_collection.find({"_id": {"$in": ids}}, {"text": 1})}
+    for hits in results:
+        for hit in hits:
+            hit["text"] = texts.get(hit["id"], "")
+    return results
 
-    distances, indices = index.search(query_vec, top_k)
-
-    results = [(chunk_map[i], distances[0][j]) for j, i in enumerate(indices[0]) if i < len(chunk_map)]
-
-    return results[0][0] if results else None
+def search_documents(query: str, top_k: int = 1):
+    results = search_documents_batch([query], top_k)[0]
+    return results[0]["filename"] if results else None
+
+# --- Query micro-batching ---
+# Concurrent /rest/retrieve_closest requests are queued and drained by a single
+# worker task. Queries arriving within BATCH_WINDOW of each other are encoded
+# and searched as one batch in a worker thread, keeping the event loop free.
+BATCH_WINDOW = 0.01
+BATCH_MAX_SIZE = 32
+
+class QueryBatcher:
+    def __init__(self, window: float = BATCH_WINDOW, max_size: int = BATCH_MAX_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self.queue = None
+        self.worker = None
+
+    async def search(self, query: str, top_k: int = 1):
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self.queue.put((query, top_k, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            queries = [query for query, _, _ in batch]
+            top_k = max(k for _, k, _ in batch)
+            try:
+                results = await loop.run_in_executor(None, search_documents_batch, queries, top_k)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, k, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result[:k])
+
+query_batcher = QueryBatcher()
 
 @agent.on_rest_post("/rest/retrieve_closest", Query, PathResponse)
+@metrics.traced("/rest/retrieve_closest")
 async def retrieve_closest(ctx: Context, req: Query) -> PathResponse:
     ctx.logger.info(f"Received query: {req.query}")
     try:
-        closest_file = search_documents(req.query)
+        results = await query_batcher.search(req.query, max(1, req.top_k))
+        closest_file = results[0]["filename"] if results else None
         if not closest_file:
             return PathResponse(
                 text="Query not found in the documents",
@@ -136,9 +588,11 @@ async def retrieve_closest(ctx: Context, req: Query) -> PathResponse:
             text="Retrieved closest statement successfully",
             agent_address=ctx.agent.address,
             path=closest_file,
+            chunks=[ChunkResult(filename=r["filename"], text=r["text"], score=r["score"]) for r in results],
             timestamp=int(time.time())
         )
     except Exception as e:
+        metrics.mark_error()
         ctx.logger.error(f"Error: {e}")
         return PathResponse(
             text=f"An error occurred: {e}",
@@ -148,14 +602,119 @@ async def retrieve_closest(ctx: Context, req: Query) -> PathResponse:
         )
     
 @agent.on_rest_post("/rest/list_files", DummyRequest, FileListResponse)
+@metrics.traced("/rest/list_files")
 async def list_files(ctx: Context, req: DummyRequest) -> FileListResponse:
     try:
-        files = txt_collection.distinct("filename")
+        files = await async_txt_collection.distinct("filename")
         return FileListResponse(files=files)
     except Exception as e:
+        metrics.mark_error()
         ctx.logger.error(f"Error listing files: {e}")
         return FileListResponse(files=[])
 
+@agent.on_rest_post("/rest/index_files", IndexRequest, IndexResponse)
+@metrics.traced("/rest/index_files")
+async def index_new_files(ctx: Context, req: IndexRequest) -> IndexResponse:
+    ctx.logger.info(f"Indexing files: {req.filenames}")
+    try:
+        added = await asyncio.to_thread(index_files, req.filenames)
+        return IndexResponse(
+            text=f"Indexed {added} chunks",
+            agent_address=ctx.agent.address,
+            chunks=added,
+            timestamp=int(time.time())
+        )
+    except Exception as e:
+        metrics.mark_error()
+        ctx.logger.error(f"Error indexing files: {e}")
+        return IndexResponse(
+            text=f"An error occurred: {e}",
+            agent_address=ctx.agent.address,
+            timestamp=int(time.time())
+        )
+
+compaction_task = None
+
+def start_compaction(ctx: Context):
+    # Reclaims tombstoned vectors in the background; searches keep using the
+    # current index until the compacted one is swapped in
+    global compaction_task
+    if compaction_task is not None and not compaction_task.done():
+        return
+
+    async def run():
+        try:
+            dropped = await asyncio.to_thread(compact_index)
+            ctx.logger.info(f"Compaction dropped {dropped} vectors")
+        except Exception as e:
+            ctx.logger.error(f"Error compacting index: {e}")
+
+    compaction_task = asyncio.create_task(run())
+
+@agent.on_rest_post("/rest/remove_files", IndexRequest, IndexResponse)
+@metrics.traced("/rest/remove_files")
+async def remove_indexed_files(ctx: Context, req: IndexRequest) -> IndexResponse:
+    ctx.logger.info(f"Removing files from index: {req.filenames}")
+    try:
+        removed = await asyncio.to_thread(remove_files, req.filenames)
+        if await asyncio.to_thread(needs_compaction):
+            start_compaction(ctx)
+        return IndexResponse(
+            text=f"Removed {removed} vectors",
+            agent_address=ctx.agent.address,
+            chunks=removed,
+            timestamp=int(time.time())
+        )
+    except Exception as e:
+        metrics.mark_error()
+        ctx.logger.error(f"Error removing files: {e}")
+        return IndexResponse(
+            text=f"An error occurred: {e}",
+            agent_address=ctx.agent.address,
+            timestamp=int(time.time())
+        )
+
+@agent.on_rest_post("/rest/rebuild_index", DummyRequest, IndexResponse)
+@metrics.traced("/rest/rebuild_index")
+async def rebuild_index(ctx: Context, req: DummyRequest) -> IndexResponse:
+    ctx.logger.info("Full index rebuild requested")
+    try:
+        await asyncio.to_thread(load_and_store_embeddings)
+        index, _, _ = index_cache.snapshot()
+        return IndexResponse(
+            text="Rebuilt embedding index",
+            agent_address=ctx.agent.address,
+            chunks=index.ntotal if index is not None else 0,
+            timestamp=int(time.time())
+        )
+    except Exception as e:
+        metrics.mark_error()
+        ctx.logger.error(f"Error rebuilding index: {e}")
+        return IndexResponse(
+            text=f"An error occurred: {e}",
+            agent_address=ctx.agent.address,
+            timestamp=int(time.time())
+        )
+
+@agent.on_event("startup")
+async def warm_up_model(ctx: Context):
+    global warm_up_task
+    warm_up_task = asyncio.create_task(asyncio.to_thread(get_embeddings))
+    ctx.logger.info("Loading embedding model in the background")
+    port = await metrics.start_http_server(8002)
+    ctx.logger.info(f"Metrics on port {port}")
+
+@agent.on_event("shutdown")
+async def stop_metrics(ctx: Context):
+    await metrics.stop_http_servers()
+
 if __name__ == "__main__":
-    load_and_store_embeddings()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="Re-embed every stored document before starting")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        load_and_store_embeddings()
+    else:
+        sync_embeddings()
     agent.run()
@@ -1,33 +1,113 @@
 import time
+import asyncio
 import base64
 import io
 import pdfplumber
 import json
 import os
+import hashlib
+import re
+import tempfile
+import threading
+import multiprocessing
+import requests
+import pyarrow as pa
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
 from bson.binary import Binary
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from bson.decimal128 import Decimal128
+from pymongo import ASCENDING, ReplaceOne, InsertOne, DeleteMany
+from aiohttp import web
 from uagents import Agent, Context, Model
 
-# ------------------- Environment Setup -------------------
+import columnar_store
+import metrics
+import rollups
+from db import get_client, DB_NAME
 
-load_dotenv()
-MONGO_URI = os.getenv("MONGODB_URI")
+# ------------------- Environment Setup -------------------
 
-client = MongoClient(MONGO_URI)
-db = client['frosthack_db']
+client = get_client()
+db = client[DB_NAME]
 
 pdf_collection = db['pdf_files']
 json_collection = db['json_files']
 txt_collection = db['txt_files']
 embedding_collection = db['embeddings']  # Optional: useful for future vector integration
+transaction_collection = db['transactions']
+llm_cache_collection = db['llm_cache']
+
+EMBEDDING_AGENT_URL = "http://localhost:8002/rest/index_files"
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+AMOUNT_CLEAN_PATTERN = re.compile(r"[^0-9.\-]")
+UPLOAD_ID_PATTERN = re.compile(r"[0-9a-fA-F-]{8,64}")
+ROW_BATCH_SIZE = 500
+
+# Pool workers start from a fresh interpreter rather than a fork of the agent,
+# so they do not inherit its event loop, Mongo clients or other threads' locks
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Table extraction is spread over this many processes for long statements
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+pdf_pool = None
+
+LAYOUT_CACHE_PATH = os.getenv("LAYOUT_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "layout_cache.json"))
+
+# Whole statements are parsed concurrently on this many processes in batch uploads
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 2)))
+batch_pool = None
+
+# upload_id -> {"next": index of the next chunk we expect, "sha256": running hash,
+#               "last_seen": monotonic time of the last chunk}
+upload_progress = {}
+# Uploads the client abandoned are discarded after this many idle seconds
+UPLOAD_IDLE_TIMEOUT = float(os.getenv("UPLOAD_IDLE_TIMEOUT", "1800"))
+UPLOAD_SWEEP_INTERVAL = 300.0
 
 # ------------------- UAgents Setup -------------------
 
 class Request(Model):
     text: str  # base64 encoded PDF
     filename: str  # original filename from frontend
+    request_id: str = ""  # set by the frontend to trace one upload across agents
+
+class UploadChunk(Model):
+    upload_id: str  # client-generated id shared by all chunks of one file
+    filename: str
+    index: int  # position of this chunk, starting at 0
+    data: str  # base64 encoded slice of the PDF
+    final: bool = False
+    request_id: str = ""
+
+class ColumnarRequest(Model):
+    files: list[str] = []  # statement filenames (any extension); empty means all
+    columns: list[str] = []  # subset of columnar_store.SCHEMA; empty means all
+    request_id: str = ""
+
+class PdfFile(Model):
+    text: str  # base64 encoded PDF
+    filename: str
+
+class BatchRequest(Model):
+    files: list[PdfFile]
+    request_id: str = ""
+
+class FileResult(Model):
+    filename: str
+    status: str  # "processed", "skipped" or "error"
+    text: str
+
+class BatchResponse(Model):
+    timestamp: int
+    text: str
+    agent_address: str
+    results: list[FileResult] = []
 
 class Response(Model):
     timestamp: int
@@ -61,119 +141,654 @@ def map_column_name(name):
             return standard_name
     return name
 
-def parse_date(date_str):
-    formats = ["%d-%m-%y", "%d %b %Y", "%d %b\n%Y", "%d\n%b %Y", "%d/%m/%Y", "%d/%m/%y"]
+DATE_FORMATS = ["%d-%m-%y", "%d %b %Y", "%d %b\n%Y", "%d\n%b %Y", "%d/%m/%Y", "%d/%m/%y"]
+STANDARD_DATE_FORMAT = "%d-%b-%Y"
+
+def parse_date_value(date_str):
     date_str = date_str.replace("\n", " ")
-    for fmt in formats:
+    for fmt in DATE_FORMATS:
         try:
-            return datetime.strptime(date_str, fmt).strftime("%d-%b-%Y")
+            return datetime.strptime(date_str, fmt)
         except ValueError:
             continue
-    return date_str
+    return None
+
+def parse_date(date_str):
+    parsed = parse_date_value(date_str)
+    return parsed.strftime(STANDARD_DATE_FORMAT) if parsed else date_str.replace("\n", " ")
+
+def normalize_row(headers, row):
+    row_data = {headers[i]: row[i] for i in range(min(len(headers), len(row))) if row[i]}
+    if 'amount' in row_data and 'type' in row_data:
+        if row_data['type'].strip().upper() == 'CR':
+            row_data['credit'] = row_data.pop('amount', '0')
+            row_data['debit'] = '0'
+        elif row_data['type'].strip().upper() == 'DR':
+            row_data['debit'] = row_data.pop('amount', '0')
+            row_data['credit'] = '0'
+    row_data.setdefault('debit', '0')
+    row_data.setdefault('credit', '0')
+    return row_data
+
+def is_header_row(row) -> bool:
+    # A header maps at least two cells onto known column roles
+    roles = {map_column_name(cell or "") for cell in row}
+    return len(roles & COLUMN_MAPPINGS.keys()) >= 2
+
+# ------------------- Layout Schemas -------------------
+# Statements from the same bank share a table layout. The column roles and the
+# date format are worked out once per layout, keyed by a fingerprint of the
+# raw header row, and persisted to LAYOUT_CACHE_PATH so later runs (and pool
+# workers) start warm. Every row then goes through LayoutSchema.convert.
+
+def header_fingerprint(row) -> str:
+    normalized = "|".join(" ".join((cell or "").lower().split()) for cell in row)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+class LayoutSchema:
+    def __init__(self, headers, date_format=None):
+        self.headers = headers
+        self.width = len(headers)
+        self.date_keys = [h for h in dict.fromkeys(headers) if "date" in h.lower()]
+        self.split_amount = "amount" in headers and "type" in headers
+        self.date_format = date_format
+
+    def to_dict(self):
+        return {"headers": self.headers, "date_format": self.date_format}
+
+    def format_date(self, value: str) -> str:
+        value = value.replace("\n", " ")
+        if self.date_format:
+            try:
+                return datetime.strptime(value, self.date_format).strftime(STANDARD_DATE_FORMAT)
+            except ValueError:
+                return parse_date(value)
+        for fmt in DATE_FORMATS:
+            try:
+                formatted = datetime.strptime(value, fmt).strftime(STANDARD_DATE_FORMAT)
+            except ValueError:
+                continue
+            self.date_format = fmt
+            save_layout_cache()
+            return formatted
+        return value
+
+    def convert(self, row):
+        # Same result as normalize_row() followed by standardize_row()
+        headers = self.headers
+        row_data = {headers[i]: row[i] for i in range(min(self.width, len(row))) if row[i]}
+        if self.split_amount and 'amount' in row_data and 'type' in row_data:
+            row_type = row_data['type'].strip().upper()
+            if row_type == 'CR':
+                row_data['credit'] = row_data.pop('amount', '0')
+                row_data['debit'] = '0'
+            elif row_type == 'DR':
+                row_data['debit'] = row_data.pop('amount', '0')
+                row_data['credit'] = '0'
+        row_data.setdefault('debit', '0')
+        row_data.setdefault('credit', '0')
+        for key in self.date_keys:
+            value = row_data.pop(key, None)
+            if value:
+                row_data["Date"] = self.format_date(value)
+        return row_data
+
+# Cached layouts depend on the column mappings and date formats they were
+# inferred with, so the cache is discarded when either changes
+LAYOUT_VERSION = hashlib.sha1(
+    json.dumps({"columns": COLUMN_MAPPINGS, "dates": DATE_FORMATS}, sort_keys=True).encode("utf-8")
+).hexdigest()
+layout_lock = threading.Lock()
+
+def load_layout_cache():
+    try:
+        with open(LAYOUT_CACHE_PATH) as f:
+            data = json.load(f)
+        if data.get("version") != LAYOUT_VERSION:
+            return {}
+        return {key: LayoutSchema(**value) for key, value in data["layouts"].items()}
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        return {}
+
+def save_layout_cache():
+    # Upload threads add layouts while others save, so write a snapshot under the lock
+    with layout_lock:
+        snapshot = dict(layout_schemas)
+        try:
+            tmp_path = f"{LAYOUT_CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "version": LAYOUT_VERSION,
+                    "layouts": {key: schema.to_dict() for key, schema in snapshot.items()},
+                }, f)
+            os.replace(tmp_path, LAYOUT_CACHE_PATH)
+        except OSError as e:
+            print(f"[WARN] Could not persist layout cache: {e}")
+
+layout_schemas = load_layout_cache()
+
+def schema_for_header(row):
+    # Returns the layout for a header row, or None if the row is not a header
+    fingerprint = header_fingerprint(row)
+    schema = layout_schemas.get(fingerprint)
+    if schema is None:
+        if not is_header_row(row):
+            return None
+        with layout_lock:
+            schema = layout_schemas.setdefault(fingerprint, LayoutSchema([map_column_name(col or "") for col in row]))
+        save_layout_cache()
+    return schema
+
+def open_pdf(pdf_source):
+    return pdfplumber.open(io.BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source)
+
+def count_pages(pdf_source) -> int:
+    with open_pdf(pdf_source) as pdf:
+        return len(pdf.pages)
+
+def extract_page_tables(pdf_source, start: int, end: int):
+    # Runs in a pool worker: raw tables for pages [start, end), in page order
+    page_tables = []
+    with open_pdf(pdf_source) as pdf:
+        for page in pdf.pages[start:end]:
+            page_tables.append(page.extract_tables())
+            page.flush_cache()
+    return page_tables
+
+def get_pdf_pool():
+    global pdf_pool
+    if pdf_pool is None:
+        pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=POOL_CONTEXT)
+    return pdf_pool
+
+def iter_page_tables(pdf_source, workers: int):
+    if isinstance(pdf_source, io.BytesIO):
+        pdf_source = pdf_source.getvalue()
+
+    page_count = count_pages(pdf_source) if workers > 1 else 0
+    if page_count <= PAGES_PER_TASK:
+        with open_pdf(pdf_source) as pdf:
+            for page in pdf.pages:
+                with metrics.stage("pdf_parse") as timer:
+                    tables = page.extract_tables()
+                    page.flush_cache()
+                    timer.items = 1
+                yield tables
+        return
+
+    # Workers get a file path rather than a pickled copy of the PDF per task
+    spool_path = None
+    if isinstance(pdf_source, bytes):
+        fd, spool_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_source)
+        pdf_source = spool_path
+
+    try:
+        # Executor.map hands results back in submission order, i.e. page order.
+        # pdf_parse then measures how long this process waits on the workers.
+        starts = range(0, page_count, PAGES_PER_TASK)
+        ends = [min(start + PAGES_PER_TASK, page_count) for start in starts]
+        results = get_pdf_pool().map(extract_page_tables, repeat(pdf_source), starts, ends)
+        while True:
+            with metrics.stage("pdf_parse") as timer:
+                page_tables = next(results, None)
+                timer.items = len(page_tables) if page_tables else 0
+            if page_tables is None:
+                return
+            yield from page_tables
+    finally:
+        if spool_path:
+            os.remove(spool_path)
+
+def iter_table_rows(pdf_source, workers: int = None):
+    # pdf_source is a path, raw bytes or a binary file object; standardized rows
+    # are yielded page by page. The current layout is carried across pages so
+    # continuation tables without a header row still map onto the right columns.
+    schema = None
+    for tables in iter_page_tables(pdf_source, workers or PDF_WORKERS):
+        for table in tables:
+            if not table:
+                continue
+            header_schema = schema_for_header(table[0])
+            if header_schema is not None:
+                schema = header_schema
+                body = table[1:]
+            elif schema is None:
+                # No recognisable header yet: treat the first row as one anyway
+                schema = LayoutSchema([map_column_name(col or "") for col in table[0]])
+                body = table[1:]
+            else:
+                body = table
+            for row in body:
+                yield schema.convert(row)
 
 def extract_table_from_pdf(pdf_bytes: bytes):
-    data = []
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            tables = page.extract_tables()
-            for table in tables:
-                headers = [map_column_name(col) for col in table[0]]
-                for row in table[1:]:
-                    row_data = {headers[i]: row[i] for i in range(len(headers)) if row[i]}
-                    if 'amount' in row_data and 'type' in row_data:
-                        if row_data['type'].strip().upper() == 'CR':
-                            row_data['credit'] = row_data.pop('amount', '0')
-                            row_data['debit'] = '0'
-                        elif row_data['type'].strip().upper() == 'DR':
-                            row_data['debit'] = row_data.pop('amount', '0')
-                            row_data['credit'] = '0'
-                    row_data.setdefault('debit', '0')
-                    row_data.setdefault('credit', '0')
-                    data.append(row_data)
-    return data
+    return list(iter_table_rows(io.BytesIO(pdf_bytes)))
+
+def standardize_row(entry):
+    date_keys = [key for key in entry if "date" in key.lower() and key != "Date"]
+    for key in date_keys:
+        if entry[key]:
+            entry["Date"] = parse_date(entry[key])
+            del entry[key]
+    return entry
 
 def standardize_json(data):
     for entry in data:
-        date_keys = [key for key in entry if "date" in key.lower()]
-        for key in date_keys:
-            if entry[key]:
-                entry["Date"] = parse_date(entry[key])
-                del entry[key]
+        standardize_row(entry)
     return data
 
+def transaction_text(entry):
+    date = entry.get("Date", "Unknown Date")
+    debit = str(entry.get("debit", "0")).replace("-", "0")
+    credit = str(entry.get("credit", "0")).replace("-", "0")
+    balance = str(entry.get("balance", "Unknown Balance"))
+    description = entry.get("description", "No description available")
+    text = (
+        f"On {date}, a transaction took place where Debit: {debit} Rs and Credit: {credit} Rs. "
+        f"Description: {description}. The balance after this transaction was {balance} Rs."
+    )
+    # Table cells keep pdfplumber's line breaks; each transaction must stay on one line
+    return " ".join(text.split())
+
+def final_balance_text(last_entry):
+    final_balance = last_entry.get("balance", "Unknown Balance")
+    return f"The final balance at the end of the transactions is {final_balance} Rs."
+
 def extract_transactions_text(transactions):
-    transaction_texts = []
-    for entry in transactions:
-        date = entry.get("Date", "Unknown Date")
-        debit = str(entry.get("debit", "0")).replace("-", "0")
-        credit = str(entry.get("credit", "0")).replace("-", "0")
-        balance = str(entry.get("balance", "Unknown Balance"))
-        description = entry.get("description", "No description available")
-        transaction_texts.append(
-            f"On {date}, a transaction took place where Debit: {debit} Rs and Credit: {credit} Rs. "
-            f"Description: {description}. The balance after this transaction was {balance} Rs."
-        )
-    full_text = " ".join(transaction_texts)
+    transaction_texts = [transaction_text(entry) for entry in transactions]
     if transactions:
-        final_balance = transactions[-1].get("balance", "Unknown Balance")
-        full_text += f" The final balance at the end of the transactions is {final_balance} Rs."
-    return full_text
+        transaction_texts.append(final_balance_text(transactions[-1]))
+    return "\n".join(transaction_texts)
+
+def notify_embedding_agent(filenames):
+    try:
+        requests.post(
+            EMBEDDING_AGENT_URL,
+            json={"filenames": filenames, "request_id": metrics.current_request_id()},
+            timeout=120
+        )
+    except Exception as e:
+        # The embedding agent picks up missed files on its next startup sync
+        print(f"[WARN] Could not reach embedding agent for {filenames}: {e}")
 
 # ------------------- Main Pipeline -------------------
 
-def full_pipeline(base64_pdf: str, filename: str) -> str:
-    pdf_bytes = base64.b64decode(base64_pdf)
-    base_filename = filename.rsplit(".", 1)[0]
-    now_utc = datetime.now(timezone.utc)
+def sha256_hex(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
 
-    # Step 1: Store PDF
+def already_processed(base_filename: str, pdf_sha256: str) -> bool:
+    # The TXT only records the PDF hash once the whole pipeline has succeeded,
+    # so a half-processed upload is never mistaken for a finished one.
+    return txt_collection.find_one(
+        {"filename": f"{base_filename}.txt", "pdf_sha256": pdf_sha256},
+        {"_id": 1}
+    ) is not None
+
+def skipped_message(base_filename: str) -> str:
+    return f"⏭️ {base_filename}.pdf is unchanged since its last upload; skipped processing"
+
+def store_pdf(base_filename: str, pdf_bytes: bytes, now_utc, pdf_sha256: str):
     pdf_collection.replace_one(
         {"filename": f"{base_filename}.pdf"},
         {
             "filename": f"{base_filename}.pdf",
             "content": Binary(pdf_bytes),
             "content_type": "application/pdf",
+            "sha256": pdf_sha256,
             "upload_time": now_utc
         },
         upsert=True
     )
 
-    # Step 2: Convert to JSON
-    raw_data = extract_table_from_pdf(pdf_bytes)
-    json_data = standardize_json(raw_data)
+def store_rows(base_filename: str, rows, now_utc):
+    # Rows are appended to the JSON document in bounded batches as they are
+    # parsed; only the narration lines are kept until the end.
+    json_filename = f"{base_filename}.json"
     json_collection.replace_one(
-        {"filename": f"{base_filename}.json"},
+        {"filename": json_filename},
         {
-            "filename": f"{base_filename}.json",
-            "content": json_data,
+            "filename": json_filename,
+            "content": [],
             "content_type": "application/json",
             "upload_time": now_utc
         },
         upsert=True
     )
 
-    # Step 3: Convert to Narration Text
-    narration = extract_transactions_text(json_data)
+    # One typed document per transaction, replaced wholesale on re-upload
+    source_file = f"{base_filename}.pdf"
+    transaction_collection.delete_many({"file": source_file})
+
+    # ...and a columnar copy of the same rows for bulk analytics
+    columnar_writer = columnar_store.StatementWriter(source_file)
+
+    def flush(batch, typed_batch):
+        json_collection.update_one({"filename": json_filename}, {"$push": {"content": {"$each": batch}}})
+        with metrics.stage("parquet_write") as timer:
+            columnar_writer.write(typed_batch)
+            timer.items = len(typed_batch)
+        transaction_collection.insert_many(typed_batch, ordered=False)
+
+    batch = []
+    typed_batch = []
+    transaction_texts = []
+    rollup_builder = rollups.RollupBuilder()
+    last_entry = None
+    try:
+        for row_index, entry in enumerate(rows):
+            typed = typed_transaction(entry, source_file, row_index)
+            batch.append(entry)
+            typed_batch.append(typed)
+            rollup_builder.add(typed)
+            transaction_texts.append(transaction_text(entry))
+            last_entry = entry
+            if len(batch) >= ROW_BATCH_SIZE:
+                flush(batch, typed_batch)
+                batch = []
+                typed_batch = []
+        if batch:
+            flush(batch, typed_batch)
+    except Exception:
+        columnar_writer.abort()
+        raise
+    columnar_writer.close()
+
+    if last_entry is not None:
+        transaction_texts.append(final_balance_text(last_entry))
+    return "\n".join(transaction_texts), rollup_builder.build()
+
+def parse_amount(value):
+    cleaned = AMOUNT_CLEAN_PATTERN.sub("", str(value or ""))
+    if cleaned.strip("-.") == "":
+        return None
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        return None
+
+def typed_transaction(entry, source_file: str, row_index: int):
+    date = None
+    if entry.get("Date"):
+        try:
+            date = datetime.strptime(entry["Date"], STANDARD_DATE_FORMAT)
+        except ValueError:
+            date = None
+    debit = parse_amount(entry.get("debit")) or Decimal(0)
+    credit = parse_amount(entry.get("credit")) or Decimal(0)
+    balance = parse_amount(entry.get("balance"))
+    return {
+        "file": source_file,
+        "row_index": row_index,
+        "date": date,
+        "description": entry.get("description"),
+        "debit": Decimal128(debit),
+        "credit": Decimal128(credit),
+        "balance": Decimal128(balance) if balance is not None else None
+    }
+
+def ensure_indexes():
+    pdf_collection.create_index([("filename", ASCENDING)])
+    txt_collection.create_index([("filename", ASCENDING), ("pdf_sha256", ASCENDING)])
+    transaction_collection.create_index([("file", ASCENDING), ("date", ASCENDING)])
+    transaction_collection.create_index([("file", ASCENDING), ("row_index", ASCENDING)], unique=True)
+    transaction_collection.create_index([("description", ASCENDING), ("date", ASCENDING)])
+
+def store_narration(base_filename: str, narration: str, statement_rollups, now_utc, pdf_sha256: str):
     txt_collection.replace_one(
         {"filename": f"{base_filename}.txt"},
         {
             "filename": f"{base_filename}.txt",
             "content": narration,
             "content_type": "text/plain",
+            "content_hash": sha256_hex(narration),
+            "pdf_sha256": pdf_sha256,
+            "rollups": statement_rollups,
             "upload_time": now_utc
         },
         upsert=True
     )
 
+def run_pipeline(base_filename: str, pdf_source, now_utc, pdf_sha256: str) -> str:
+    # Step 2: Convert to JSON, page by page
+    narration, statement_rollups = store_rows(base_filename, iter_table_rows(pdf_source), now_utc)
+
+    # Step 3: Store Narration Text and its daily/weekly/monthly rollups
+    store_narration(base_filename, narration, statement_rollups, now_utc, pdf_sha256)
+
+    # Cached LLM answers built from the previous version of this file are stale
+    llm_cache_collection.delete_many({"files": f"{base_filename}.txt"})
+
+    # Step 4: Embed only this file's chunks into the live index
+    notify_embedding_agent([f"{base_filename}.txt"])
+
     return f"✅ Successfully processed and stored {base_filename}.pdf → .json → .txt"
 
+def full_pipeline(base64_pdf: str, filename: str) -> str:
+    with metrics.stage("pdf_decode"):
+        pdf_bytes = base64.b64decode(base64_pdf)
+    base_filename = filename.rsplit(".", 1)[0]
+    pdf_sha256 = sha256_hex(pdf_bytes)
+    if already_processed(base_filename, pdf_sha256):
+        return skipped_message(base_filename)
+    now_utc = datetime.now(timezone.utc)
+
+    # Step 1: Store PDF
+    store_pdf(base_filename, pdf_bytes, now_utc, pdf_sha256)
+    return run_pipeline(base_filename, io.BytesIO(pdf_bytes), now_utc, pdf_sha256)
+
+def file_pipeline(path: str, filename: str, pdf_sha256: str) -> str:
+    base_filename = filename.rsplit(".", 1)[0]
+    if already_processed(base_filename, pdf_sha256):
+        return skipped_message(base_filename)
+    now_utc = datetime.now(timezone.utc)
+
+    # Step 1: Store PDF (the bytes are released before parsing starts)
+    with open(path, "rb") as f:
+        store_pdf(base_filename, f.read(), now_utc, pdf_sha256)
+    return run_pipeline(base_filename, path, now_utc, pdf_sha256)
+
+# ------------------- Chunked Uploads -------------------
+# The frontend sends large PDFs as a sequence of small chunks that are spooled
+# to disk, so no request body ever holds the whole file. uAgents REST handlers
+# only accept JSON bodies, hence each chunk is still base64 encoded.
+
+def upload_path(upload_id: str) -> str:
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise ValueError(f"Invalid upload id: {upload_id}")
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+def append_upload_chunk(upload_id: str, index: int, data: str):
+    progress = upload_progress.get(upload_id) or {"next": 0, "sha256": hashlib.sha256()}
+    if index != progress["next"]:
+        raise ValueError(f"Expected chunk {progress['next']} for upload {upload_id}, got {index}")
+
+    path = upload_path(upload_id)
+    with metrics.stage("pdf_decode"):
+        chunk = base64.b64decode(data)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    with open(path, "wb" if index == 0 else "ab") as f:
+        f.write(chunk)
+    # The PDF hash is built up as chunks arrive, so it is ready on the last one
+    progress["sha256"].update(chunk)
+    progress["next"] = index + 1
+    progress["last_seen"] = time.monotonic()
+    upload_progress[upload_id] = progress
+    return path, progress["sha256"].hexdigest()
+
+def discard_upload(upload_id: str):
+    upload_progress.pop(upload_id, None)
+    try:
+        os.remove(upload_path(upload_id))
+    except (OSError, ValueError):
+        pass
+
+def sweep_uploads() -> int:
+    now = time.monotonic()
+    idle = [upload_id for upload_id, progress in list(upload_progress.items())
+            if now - progress["last_seen"] > UPLOAD_IDLE_TIMEOUT]
+    for upload_id in idle:
+        discard_upload(upload_id)
+    return len(idle)
+
+def remove_stale_uploads():
+    # No upload survives a restart, so every partial file left behind is stale
+    try:
+        names = os.listdir(UPLOAD_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith(".part"):
+            try:
+                os.remove(os.path.join(UPLOAD_DIR, name))
+            except OSError:
+                pass
+
+# ------------------- Batch Ingestion -------------------
+# Many small statements are parsed side by side on a process pool and written
+# with one bulk_write per collection; the embedding agent is notified once.
+
+def parse_statement(pdf_bytes: bytes):
+    # Runs in a pool worker; pages are read serially inside each worker
+    return list(iter_table_rows(pdf_bytes, workers=1))
+
+def get_batch_pool():
+    global batch_pool
+    if batch_pool is None:
+        batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=POOL_CONTEXT)
+    return batch_pool
+
+def statement_records(base_filename: str, entries, now_utc, pdf_sha256: str):
+    source_file = f"{base_filename}.pdf"
+    typed_rows = [typed_transaction(entry, source_file, i) for i, entry in enumerate(entries)]
+    narration = extract_transactions_text(entries)
+    rollup_builder = rollups.RollupBuilder()
+    for row in typed_rows:
+        rollup_builder.add(row)
+
+    json_doc = {
+        "filename": f"{base_filename}.json",
+        "content": entries,
+        "content_type": "application/json",
+        "upload_time": now_utc
+    }
+    txt_doc = {
+        "filename": f"{base_filename}.txt",
+        "content": narration,
+        "content_type": "text/plain",
+        "content_hash": sha256_hex(narration),
+        "pdf_sha256": pdf_sha256,
+        "rollups": rollup_builder.build(),
+        "upload_time": now_utc
+    }
+    return json_doc, typed_rows, txt_doc
+
+def batch_pipeline(files):
+    now_utc = datetime.now(timezone.utc)
+    # Results are kept by position, since the same name can appear twice
+    results = [None] * len(files)
+    pending = {}
+    seen = {}
+
+    # Decode, hash and drop unchanged files with a single lookup
+    for i, item in enumerate(files):
+        base_filename = item.filename.rsplit(".", 1)[0]
+        # a.pdf and a.PDF would both be stored as a.txt
+        if base_filename in seen:
+            results[i] = ("error", f"❌ Duplicate of {seen[base_filename]} in this batch; upload it separately.")
+            continue
+        seen[base_filename] = item.filename
+        try:
+            with metrics.stage("pdf_decode"):
+                pdf_bytes = base64.b64decode(item.text)
+        except Exception as e:
+            results[i] = ("error", f"❌ Failed to decode: {e}")
+            continue
+        pending[base_filename] = (i, pdf_bytes, sha256_hex(pdf_bytes))
+
+    known = {
+        doc["filename"]: doc.get("pdf_sha256")
+        for doc in txt_collection.find(
+            {"filename": {"$in": [f"{base}.txt" for base in pending]}},
+            {"filename": 1, "pdf_sha256": 1}
+        )
+    }
+    for base_filename in list(pending):
+        i, _, pdf_sha256 = pending[base_filename]
+        if known.get(f"{base_filename}.txt") == pdf_sha256:
+            results[i] = ("skipped", skipped_message(base_filename))
+            del pending[base_filename]
+
+    # Parse the remaining files concurrently
+    pool = get_batch_pool()
+    futures = {base: pool.submit(parse_statement, pdf_bytes) for base, (_, pdf_bytes, _) in pending.items()}
+
+    pdf_ops, json_ops, txt_ops, transaction_ops = [], [], [], []
+    txt_filenames = []
+    for base_filename, future in futures.items():
+        i, pdf_bytes, pdf_sha256 = pending[base_filename]
+        try:
+            # Parsing happens in the pool; this is the time spent waiting for it
+            with metrics.stage("pdf_parse_batch") as timer:
+                entries = future.result()
+                timer.items = len(entries)
+        except Exception as e:
+            results[i] = ("error", f"❌ Failed to process: {e}")
+            continue
+
+        json_doc, typed_rows, txt_doc = statement_records(base_filename, entries, now_utc, pdf_sha256)
+        source_file = f"{base_filename}.pdf"
+
+        writer = columnar_store.StatementWriter(source_file)
+        if typed_rows:
+            writer.write(typed_rows)
+        writer.close()
+
+        pdf_ops.append(ReplaceOne(
+            {"filename": source_file},
+            {
+                "filename": source_file,
+                "content": Binary(pdf_bytes),
+                "content_type": "application/pdf",
+                "sha256": pdf_sha256,
+                "upload_time": now_utc
+            },
+            upsert=True
+        ))
+        json_ops.append(ReplaceOne({"filename": json_doc["filename"]}, json_doc, upsert=True))
+        txt_ops.append(ReplaceOne({"filename": txt_doc["filename"]}, txt_doc, upsert=True))
+        txt_filenames.append(txt_doc["filename"])
+        transaction_ops.append(DeleteMany({"file": source_file}))
+        transaction_ops.extend(InsertOne(row) for row in typed_rows)
+        results[i] = ("processed", f"✅ Successfully processed and stored {base_filename}.pdf → .json → .txt")
+
+    if txt_ops:
+        pdf_collection.bulk_write(pdf_ops, ordered=False)
+        json_collection.bulk_write(json_ops, ordered=False)
+        transaction_collection.bulk_write(transaction_ops, ordered=True)
+        # TXT last: its pdf_sha256 marks the statement as fully processed
+        txt_collection.bulk_write(txt_ops, ordered=False)
+
+        llm_cache_collection.delete_many({"files": {"$in": txt_filenames}})
+        notify_embedding_agent(txt_filenames)
+
+    return [
+        FileResult(filename=item.filename, status=status, text=text)
+        for item, (status, text) in zip(files, results)
+    ]
+
 # ------------------- REST Endpoint -------------------
 
 @agent.on_rest_post("/rest/process_pdf", Request, Response)
+@metrics.traced("/rest/process_pdf")
 async def handle_pdf(ctx: Context, req: Request) -> Response:
     try:
         original_filename = req.filename
-        msg = full_pipeline(req.text, original_filename)
+        # Parsing is CPU-bound and uses blocking pymongo; keep it off the event loop
+        msg = await asyncio.to_thread(full_pipeline, req.text, original_filename)
 
         return Response(
             timestamp=int(time.time()),
@@ -182,12 +797,179 @@ async def handle_pdf(ctx: Context, req: Request) -> Response:
         )
     except Exception as e:
         ctx.logger.error(f"Error: {e}")
+        metrics.mark_error()
         return Response(
             timestamp=int(time.time()),
             text=f"❌ Failed to process: {e}",
             agent_address=ctx.agent.address
         )
 
+@agent.on_rest_post("/rest/process_pdf_batch", BatchRequest, BatchResponse)
+@metrics.traced("/rest/process_pdf_batch")
+async def handle_pdf_batch(ctx: Context, req: BatchRequest) -> BatchResponse:
+    try:
+        results = await asyncio.to_thread(batch_pipeline, req.files)
+        processed = sum(1 for r in results if r.status == "processed")
+        skipped = sum(1 for r in results if r.status == "skipped")
+        return BatchResponse(
+            timestamp=int(time.time()),
+            text=f"Processed {processed}, skipped {skipped}, failed {len(results) - processed - skipped} of {len(results)} file(s)",
+            agent_address=ctx.agent.address,
+            results=results
+        )
+    except Exception as e:
+        ctx.logger.error(f"Error: {e}")
+        metrics.mark_error()
+        return BatchResponse(
+            timestamp=int(time.time()),
+            text=f"❌ Failed to process batch: {e}",
+            agent_address=ctx.agent.address
+        )
+
+@agent.on_rest_post("/rest/upload_chunk", UploadChunk, Response)
+@metrics.traced("/rest/upload_chunk")
+async def handle_upload_chunk(ctx: Context, req: UploadChunk) -> Response:
+    try:
+        path, pdf_sha256 = await asyncio.to_thread(append_upload_chunk, req.upload_id, req.index, req.data)
+        if not req.final:
+            return Response(
+                timestamp=int(time.time()),
+                text=f"Received chunk {req.index}",
+                agent_address=ctx.agent.address
+            )
+        # Complete; processing may outlast the idle timeout, so keep it out of the sweep
+        upload_progress.pop(req.upload_id, None)
+
+        try:
+            msg = await asyncio.to_thread(file_pipeline, path, req.filename, pdf_sha256)
+        finally:
+            discard_upload(req.upload_id)
+
+        return Response(
+            timestamp=int(time.time()),
+            text=msg,
+            agent_address=ctx.agent.address
+        )
+    except Exception as e:
+        ctx.logger.error(f"Error: {e}")
+        metrics.mark_error()
+        discard_upload(req.upload_id)
+        return Response(
+            timestamp=int(time.time()),
+            text=f"❌ Failed to process: {e}",
+            agent_address=ctx.agent.address
+        )
+
+@agent.on_event("startup")
+async def create_indexes(ctx: Context):
+    await asyncio.to_thread(ensure_indexes)
+    await asyncio.to_thread(remove_stale_uploads)
+    await start_columnar_server(ctx)
+    port = await metrics.start_http_server(8000)
+    ctx.logger.info(f"Metrics on port {port}")
+
+@agent.on_interval(period=UPLOAD_SWEEP_INTERVAL)
+async def expire_uploads(ctx: Context):
+    expired = sweep_uploads()
+    if expired:
+        ctx.logger.info(f"Discarded {expired} abandoned upload(s)")
+
+@agent.on_event("shutdown")
+async def stop_servers(ctx: Context):
+    if columnar_runner is not None:
+        await columnar_runner.cleanup()
+    await metrics.stop_http_servers()
+
+# === Columnar Export ===
+# uAgents REST handlers return a single JSON body, so the Arrow export is
+# served by a small aiohttp app on its own port. POST a ColumnarRequest body
+# to /stream/columnar and read an Arrow IPC stream
+# (application/vnd.apache.arrow.stream), sent one record batch at a time, so
+# neither side holds more than a batch in memory.
+COLUMNAR_PORT = int(os.getenv("FETCH_STREAM_PORT", "8012"))
+COLUMNAR_BATCH_ROWS = 64 * 1024
+columnar_runner = None
+
+class ChunkSink:
+    # Write-only file object for the IPC writer; drain() hands over what has
+    # been written since the last call
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_schema(columns):
+    unknown = [name for name in columns if name not in columnar_store.SCHEMA.names]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}. Expected any of {columnar_store.SCHEMA.names}")
+    if not columns:
+        return columnar_store.SCHEMA
+    return pa.schema([columnar_store.SCHEMA.field(name) for name in columns])
+
+async def stream_columnar(request: web.Request) -> web.StreamResponse:
+    logger = request.app["logger"]
+    try:
+        req = ColumnarRequest(**(await request.json() if request.can_read_body else {}))
+        schema = export_schema(req.columns)
+    except Exception as e:
+        return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+
+    with metrics.request_trace("/stream/columnar", req.request_id):
+        response = web.StreamResponse(headers={"Content-Type": "application/vnd.apache.arrow.stream"})
+        await response.prepare(request)
+        sink = ChunkSink()
+        rows = 0
+        try:
+            with pa.ipc.new_stream(sink, schema) as writer:
+                await response.write(sink.drain())
+                # Files are read in a worker thread, one at a time
+                tables = columnar_store.iter_tables(req.files or None, req.columns or None)
+                while (table := await asyncio.to_thread(next, tables, None)) is not None:
+                    for batch in table.to_batches(max_chunksize=COLUMNAR_BATCH_ROWS):
+                        writer.write_batch(batch)
+                        rows += batch.num_rows
+                        await response.write(sink.drain())
+            # End-of-stream marker
+            await response.write(sink.drain())
+            await response.write_eof()
+            logger.info(f"Exported {rows} rows")
+        except ConnectionResetError:
+            metrics.mark_error()
+            logger.info(f"Client disconnected after {rows} exported rows")
+    return response
+
+async def start_columnar_server(ctx: Context):
+    global columnar_runner
+    app = web.Application()
+    app["logger"] = ctx.logger
+    app.router.add_post("/stream/columnar", stream_columnar)
+    columnar_runner = web.AppRunner(app)
+    await columnar_runner.setup()
+    await web.TCPSite(columnar_runner, "0.0.0.0", COLUMNAR_PORT).start()
+    ctx.logger.info(f"Columnar export on port {COLUMNAR_PORT}")
+
 # ------------------- Run Agent -------------------
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+# launcher.py
+# Hosts several agents in one process instead of one process per agent, e.g.
+#
+#   python launcher.py                          # all five agents
+#   python launcher.py --agents query chart     # a subset
+#
+# Hosted agents share the Mongo connection pools from db.py and a single
+# embedding model, which is loaded and warmed in the background while the
+# other agents already serve requests. Each agent keeps its usual port.
+# GET http://localhost:8010/ready reports per-agent readiness, startup time and
+# resident memory (503 until everything is ready).
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import resource
+import time
+
+from aiohttp import web
+
+# name -> (module, agent attribute, REST port)
+AGENTS = {
+    "fetch": ("fetch_agent", "agent", 8000),
+    "query": ("query_agent", "agent", 8001),
+    "embedding": ("embedding_agent", "agent", 8002),
+    "chart": ("chart_agent", "agent", 8003),
+    "delete": ("delete_agent", "delete_agent", 8005),
+}
+STATUS_PORT = int(os.getenv("LAUNCHER_STATUS_PORT", "8010"))
+READY_POLL_INTERVAL = 0.2
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # Peak rather than current RSS; kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+async def port_open(port: int) -> bool:
+    try:
+        _, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return False
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+class Host:
+    def __init__(self, names, sync_index: bool):
+        self.names = names
+        self.sync_index = sync_index
+        self.started = time.perf_counter()
+        self.import_s = {}
+        self.modules = {}
+        self.listening = {name: False for name in names}
+        self.index_synced = not (sync_index and "embedding" in names)
+        self.ready_s = None
+
+    def import_agents(self):
+        for name in self.names:
+            start = time.perf_counter()
+            self.modules[name] = importlib.import_module(AGENTS[name][0])
+            self.import_s[name] = round(time.perf_counter() - start, 3)
+
+    def model_ready(self) -> bool:
+        embedding = self.modules.get("embedding")
+        return embedding is None or embedding.model_ready.is_set()
+
+    def ready(self) -> bool:
+        return all(self.listening.values()) and self.model_ready() and self.index_synced
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "agents": {name: {"port": AGENTS[name][2], "listening": self.listening[name]} for name in self.names},
+            "embedding_model_ready": self.model_ready(),
+            "index_synced": self.index_synced,
+            "import_s": self.import_s,
+            "uptime_s": round(time.perf_counter() - self.started, 3),
+            "ready_after_s": self.ready_s,
+            "rss_mb": rss_mb(),
+        }
+
+    async def sync_embeddings(self):
+        try:
+            await asyncio.to_thread(self.modules["embedding"].sync_embeddings)
+        except Exception as e:
+            print(f"[ERROR] Initial index sync failed: {e}")
+        self.index_synced = True
+
+    async def watch_readiness(self):
+        while not self.ready():
+            for name in self.names:
+                if not self.listening[name]:
+                    self.listening[name] = await port_open(AGENTS[name][2])
+            await asyncio.sleep(READY_POLL_INTERVAL)
+        self.ready_s = round(time.perf_counter() - self.started, 3)
+        print(json.dumps({"event": "ready", **self.status()}))
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        return web.json_response(self.status(), status=200 if self.ready() else 503)
+
+    async def start_status_server(self):
+        app = web.Application()
+        app.router.add_get("/ready", self.handle_ready)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", STATUS_PORT).start()
+        return runner
+
+    async def run(self):
+        self.import_agents()
+        runner = await self.start_status_server()
+        agents = [getattr(self.modules[name], AGENTS[name][1]) for name in self.names]
+        background = [asyncio.create_task(self.watch_readiness())]
+        if not self.index_synced:
+            background.append(asyncio.create_task(self.sync_embeddings()))
+        try:
+            await asyncio.gather(*(agent.run_async() for agent in agents))
+        finally:
+            for task in background:
+                task.cancel()
+            await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", nargs="+", choices=list(AGENTS), default=list(AGENTS))
+    parser.add_argument("--no-sync", action="store_true", help="Skip indexing new statements at startup")
+    args = parser.parse_args()
+
+    host = Host(list(dict.fromkeys(args.agents)), sync_index=not args.no_sync)
+    try:
+        asyncio.run(host.run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# llm_cache.py
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+
+# ASI is called at temperature 0, so the same context, prompt template, model
+# and question always produce the same answer. Answers are kept in a small
+# in-process LRU in front of a Mongo collection with a TTL index.
+#
+# Keys include a hash of the full context, so a re-uploaded file with different
+# content can never hit an old answer. Whole-file contexts reuse the narration
+# hash fetch_agent stores on each TXT document instead of re-hashing it.
+# fetch_agent additionally deletes the Mongo entries that reference a file
+# whenever that file is uploaded again.
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_LRU_SIZE = int(os.getenv("LLM_CACHE_LRU_SIZE", "256"))
+LLM_CACHE_COLLECTION = "llm_cache"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_key(context_hash: str, template: str, model: str, query: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, template, query, context_hash):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class AnswerCache:
+    def __init__(self, collection, max_entries: int = LLM_CACHE_LRU_SIZE, ttl: int = LLM_CACHE_TTL):
+        self.collection = collection  # motor collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.indexes_ready = False
+
+    async def ensure_indexes(self):
+        if self.indexes_ready:
+            return
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
+        await self.collection.create_index("files")
+        self.indexes_ready = True
+
+    def _remember(self, key: str, answer: str, expires_at: float):
+        self.entries[key] = (answer, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry:
+            answer, expires_at = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(key)
+                return answer
+            del self.entries[key]
+
+        try:
+            doc = await self.collection.find_one({"_id": key})
+        except Exception as e:
+            # The cache is best-effort; a Mongo hiccup must not fail the request
+            print(f"[WARN] LLM cache lookup failed: {e}")
+            return None
+        if not doc:
+            return None
+        created_at = doc["created_at"].replace(tzinfo=timezone.utc)
+        expires_at = (created_at + timedelta(seconds=self.ttl)).timestamp()
+        if expires_at <= time.time():
+            return None
+        self._remember(key, doc["answer"], expires_at)
+        return doc["answer"]
+
+    async def set(self, key: str, answer: str, files: list[str]):
+        self._remember(key, answer, time.time() + self.ttl)
+        try:
+            await self.ensure_indexes()
+            await self.collection.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "answer": answer,
+                    "files": files,
+                    "created_at": datetime.now(timezone.utc)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            print(f"[WARN] LLM cache write failed: {e}")
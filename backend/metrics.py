@@ -0,0 +1,242 @@
+# metrics.py
+import os
+import time
+import uuid
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from aiohttp import web
+from pymongo import monitoring
+
+# Process-wide latency histograms and counters in Prometheus text format.
+# Each agent serves them on GET /metrics at its REST port + METRICS_PORT_OFFSET
+# (fetch 9000, query 9001, embedding 9002, chart 9003, delete 9005); agents
+# hosted together by launcher.py share one registry.
+#
+# Stages are timed with `with metrics.stage("embedding") as s: ... s.items = n`.
+# Every Mongo command is timed by a pymongo command listener installed by db.py.
+# REST handlers wrapped with @metrics.traced(route) run inside a request trace:
+# the frontend sends a request_id with each user action, agents forward it on
+# calls to other agents, and one [TRACE] line per request lists its stage
+# timings, so a single action can be followed across the agents' logs.
+
+METRICS_PORT_OFFSET = int(os.getenv("METRICS_PORT_OFFSET", "1000"))
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def label_text(labelnames, values) -> str:
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{label_text(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labelnames + ("le",)
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{label_text(bucket_labels, key + (repr(bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{label_text(bucket_labels, key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{label_text(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{label_text(self.labelnames, key)} {series[-1]}")
+        return lines
+
+STAGE_SECONDS = Histogram("frosthack_stage_seconds", "Time spent in each processing stage", ["stage"])
+STAGE_ITEMS = Counter("frosthack_stage_items_total", "Items processed per stage (pages, rows, chunks, queries)", ["stage"])
+MONGO_SECONDS = Histogram("frosthack_mongo_command_seconds", "Mongo command latency", ["command", "collection"])
+MONGO_FAILURES = Counter("frosthack_mongo_command_failures_total", "Failed Mongo commands", ["command", "collection"])
+ASI_TOKENS = Counter("frosthack_asi_tokens_total", "Tokens sent to (prompt) and received from (completion) ASI", ["kind"])
+REQUEST_SECONDS = Histogram("frosthack_request_seconds", "Handler latency per route", ["route"])
+REQUESTS = Counter("frosthack_requests_total", "Handled requests per route and outcome", ["route", "status"])
+
+REGISTRY = [STAGE_SECONDS, STAGE_ITEMS, MONGO_SECONDS, MONGO_FAILURES, ASI_TOKENS, REQUEST_SECONDS, REQUESTS]
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+# --- Request traces ---
+_trace = contextvars.ContextVar("frosthack_trace", default=None)
+
+class RequestTrace:
+    def __init__(self, route: str, request_id: str):
+        self.route = route
+        self.request_id = request_id or uuid.uuid4().hex
+        self.status = "ok"
+        self.stages = []
+        self.started = time.perf_counter()
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(elapsed, route=self.route)
+        REQUESTS.inc(route=self.route, status=self.status)
+        stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages)
+        print(f"[TRACE] request_id={self.request_id} route={self.route} status={self.status} total={elapsed * 1000:.1f}ms {stages}".rstrip())
+
+def current_request_id() -> str:
+    trace = _trace.get()
+    return trace.request_id if trace else ""
+
+def mark_error():
+    trace = _trace.get()
+    if trace is not None:
+        trace.status = "error"
+
+@contextmanager
+def request_trace(route: str, request_id: str = ""):
+    trace = RequestTrace(route, request_id)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.status = "error"
+        raise
+    finally:
+        _trace.reset(token)
+        trace.finish()
+
+def traced(route: str):
+    # Wraps a uAgents REST handler (ctx, req) in a request trace
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(ctx, req):
+            with request_trace(route, getattr(req, "request_id", "")):
+                return await handler(ctx, req)
+        return wrapper
+    return decorate
+
+# --- Stage timers ---
+class StageTimer:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.name, time.perf_counter() - self.started, self.items)
+        return False
+
+def stage(name: str) -> StageTimer:
+    return StageTimer(name)
+
+def record(name: str, seconds: float, items: int = 0):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if items:
+        STAGE_ITEMS.inc(items, stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.stages.append((name, seconds))
+
+# --- Mongo command timing ---
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = target if isinstance(target, str) else ""
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self.lock:
+            collection = self.pending.pop((event.connection_id, event.request_id), None)
+        return collection
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, command=event.command_name, collection=collection)
+        trace = _trace.get()
+        if trace is not None:
+            trace.stages.append((f"mongo.{event.command_name}.{collection}", seconds))
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection is None:
+            return
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, collection=collection)
+        MONGO_FAILURES.inc(command=event.command_name, collection=collection)
+
+mongo_listener = MongoCommandListener()
+
+# --- HTTP endpoint ---
+_servers = {}
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+async def start_http_server(agent_port: int):
+    # Idempotent per port, so hosted agents can all call it
+    port = agent_port + METRICS_PORT_OFFSET
+    if port in _servers:
+        return port
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    _servers[port] = runner
+    return port
+
+async def stop_http_servers():
+    for port in list(_servers):
+        await _servers.pop(port).cleanup()
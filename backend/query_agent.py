@@ -1,30 +1,42 @@
 import os
-import time
 import json
-import requests
+import time
 from typing import Optional
 
-from pymongo import MongoClient
-from dotenv import load_dotenv
 from uagents import Agent, Context, Model
 
-# === Load environment variables ===
-load_dotenv()
-ASI_API_KEY = os.getenv("ASI_API_KEY")
-MONGO_URI = os.getenv("MONGODB_URI")
+import asyncio
+import pandas as pd
+from aiohttp import web
+
+import asi_client
+import metrics
+from db import get_async_client, DB_NAME
+import llm_cache
+import aggregate_engine
+import columnar_store
+import rollups
 
-# === MongoDB Setup ===
-client = MongoClient(MONGO_URI)
-db = client['frosthack_db']
+# === MongoDB Setup (async, shared pool) ===
+client = get_async_client()
+db = client[DB_NAME]
 pdf_collection = db['pdf_files']
 json_collection = db['json_files']
 txt_collection = db['txt_files']
 embedding_collection = db['embeddings']
+transaction_collection = db['transactions']
 
 # === UAgent Definitions ===
+class ChunkContext(Model):
+    filename: str
+    text: str
+    score: float = 0.0
+
 class Query(Model):
     query: str
-    path: str
+    path: Optional[str] = None
+    chunks: list[ChunkContext] = []
+    request_id: str = ""
 
 class QueryResponse(Model):
     timestamp: int
@@ -42,63 +54,254 @@ agent = Agent(
 )
 
 # === ASI API Call ===
-def query_asi(context: str, query: str) -> Optional[str]:
-    try:
-        url = "https://api.asi1.ai/v1/chat/completions"
-        prompt = f"""
+PROMPT_TEMPLATE = """
         Context: {context}
 
         Question: {query}
         """
-        payload = json.dumps({
-            "model": "asi1-mini",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0,
-            "stream": False,
-            "max_tokens": 8000
-        })
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': 'Bearer ' + ASI_API_KEY,
-        }
-
-        response = requests.post(url, headers=headers, data=payload)
-
-        if response.status_code == 200:
-            data = response.json()
-            if "choices" in data and len(data["choices"]) > 0:
-                return data["choices"][0]["message"]["content"]
-        return f"Error from ASI API: Status Code {response.status_code}"
+
+answer_cache = llm_cache.AnswerCache(db[llm_cache.LLM_CACHE_COLLECTION])
+
+async def query_asi(context: str, query: str, files: list[str], context_hash: Optional[str] = None) -> Optional[str]:
+    key = llm_cache.make_key(context_hash or llm_cache.content_hash(context), PROMPT_TEMPLATE, asi_client.ASI_MODEL, query)
+    cached = await answer_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        answer = await asi_client.chat_completion(PROMPT_TEMPLATE.format(context=context, query=query))
+    except asi_client.ASIError as e:
+        return f"Error from ASI API: {e}"
     except Exception as e:
         return f"Exception during ASI API call: {str(e)}"
 
-# === REST Endpoint for Query Processing ===
-@agent.on_rest_post("/rest/process_query", Query, QueryResponse)
-async def process_query(ctx: Context, req: Query) -> QueryResponse:
-    ctx.logger.info(f"Processing Query: {req.query} on file: {req.path}")
+    await answer_cache.set(key, answer, files)
+    return answer
+
+# === Context Building ===
+def build_chunk_context(chunks) -> str:
+    # Group retrieved chunks by statement so the model knows where each came from
+    by_file = {}
+    for chunk in chunks:
+        by_file.setdefault(chunk.filename, []).append(chunk.text)
+    return "\n\n".join(
+        f"From statement {filename}:\n" + "\n".join(texts)
+        for filename, texts in by_file.items()
+    )
+
+async def build_rollup_context(path: Optional[str], level: str):
+    # Rollups of one statement, or of every statement when no path is given
+    query = {"filename": path} if path else {"rollups": {"$exists": True}}
+    docs = await txt_collection.find(query, {"filename": 1, "rollups": 1}).to_list(None)
+    rollups_by_file = {doc["filename"]: doc["rollups"] for doc in docs if doc.get("rollups")}
+    if not rollups_by_file:
+        return None, []
+    return rollups.render(rollups_by_file, level), sorted(rollups_by_file)
+
+# === Aggregate Fast Path ===
+TRANSACTION_COLUMNS = ["date", "description", "debit", "credit", "balance"]
+
+async def load_transactions(path: Optional[str]):
+    # Returns the transactions of the given statement (or of every stored one)
+    # and the statements for which no transaction rows exist at all. Each
+    # statement comes from its memory-mapped Parquet copy when it has one and
+    # from Mongo otherwise, since statements ingested before the Parquet copy
+    # existed have only Mongo rows (and older ones not even those).
+    filenames = [path] if path else await txt_collection.distinct("filename")
+    in_parquet = [f for f in filenames if columnar_store.has_statement(f)]
+    frames = []
+    if in_parquet:
+        table = await asyncio.to_thread(columnar_store.load_table, in_parquet, TRANSACTION_COLUMNS)
+        if table is not None and table.num_rows:
+            frames.append(table.to_pandas())
+
+    # Mongo converts the numeric columns to doubles for us
+    in_mongo = {f"{f.rsplit('.', 1)[0]}.pdf": f for f in filenames if f not in in_parquet}
+    missing = []
+    if in_mongo:
+        pipeline = [
+            {"$match": {"file": {"$in": list(in_mongo)}}},
+            {"$project": {
+                "_id": 0,
+                "file": 1,
+                "date": 1,
+                "description": 1,
+                "debit": {"$toDouble": "$debit"},
+                "credit": {"$toDouble": "$credit"},
+                "balance": {"$toDouble": "$balance"}
+            }}
+        ]
+        rows = await transaction_collection.aggregate(pipeline).to_list(None)
+        found = {row["file"] for row in rows}
+        missing = [txt for pdf, txt in in_mongo.items() if pdf not in found]
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=TRANSACTION_COLUMNS)
+    return df, missing
+
+async def answer_from_transactions(query: str, path: Optional[str]) -> Optional[str]:
+    intent = aggregate_engine.classify_query(query)
+    if intent is None:
+        return None
+    with metrics.stage("aggregate_answer") as timer:
+        df, missing = await load_transactions(path)
+        timer.items = len(df)
+        if missing:
+            # A total that silently leaves statements out is worse than
+            # letting ASI answer from the narration
+            print(f"[INFO] No transaction rows for {missing}; not answering from transaction data.")
+            return None
+        return await asyncio.to_thread(aggregate_engine.answer_query, intent, df)
+
+# === Query Preparation ===
+class PreparedQuery:
+    # Either a final answer that needs no LLM call, or the context to send to ASI
+    def __init__(self, text: str, answer: Optional[str] = None, context: Optional[str] = None,
+                 files: Optional[list[str]] = None, context_hash: Optional[str] = None):
+        self.text = text
+        self.answer = answer
+        self.context = context
+        self.files = files or []
+        self.context_hash = context_hash
+
+async def prepare_query(logger, req: Query) -> PreparedQuery:
+    try:
+        answer = await answer_from_transactions(req.query, req.path)
+    except Exception as e:
+        metrics.mark_error()
+        logger.error(f"Aggregate fast path failed, falling back to ASI: {e}")
+        answer = None
+    if answer is not None:
+        logger.info(f"Answered '{req.query}' from transaction data")
+        return PreparedQuery("Query answered from transaction data", answer=answer)
+
+    # Daily/weekly/monthly questions also get that level's rollups
+    level = rollups.choose_level(req.query)
+    rollup_context, rollup_files = await build_rollup_context(req.path, level) if level else (None, [])
 
-    doc = txt_collection.find_one({"filename": req.path})
+    if req.chunks:
+        context = build_chunk_context(req.chunks)
+        files = {chunk.filename for chunk in req.chunks}
+        if rollup_context:
+            # Rollups give the trend; the chunks keep the individual transactions
+            context = f"{rollup_context}\n\n{context}"
+            files.update(rollup_files)
+        logger.info(f"Processing Query: {req.query} on {len(req.chunks)} retrieved chunks"
+                    + (f" and {level} rollups" if rollup_context else ""))
+        return PreparedQuery("Query processed successfully", context=context, files=sorted(files))
+
+    if rollup_context:
+        logger.info(f"Processing Query: {req.query} on {level} rollups of {len(rollup_files)} statement(s)")
+        return PreparedQuery("Query processed successfully", context=rollup_context, files=rollup_files)
+
+    logger.info(f"Processing Query: {req.query} on file: {req.path}")
+    doc = await txt_collection.find_one({"filename": req.path})
     if not doc or "content" not in doc:
         error_msg = f"File '{req.path}' not found in database or missing content."
-        ctx.logger.error(error_msg)
-        return QueryResponse(
-            text="File not found or invalid in DB",
-            agent_address=ctx.agent.address,
-            answer=error_msg,
-            timestamp=int(time.time())
-        )
+        logger.error(error_msg)
+        return PreparedQuery("File not found or invalid in DB", answer=error_msg)
+
+    return PreparedQuery(
+        "Query processed successfully",
+        context=doc["content"],
+        files=[req.path],
+        context_hash=doc.get("content_hash")
+    )
 
-    context = doc["content"]
-    answer = query_asi(context, req.query)
+# === REST Endpoint for Query Processing ===
+@agent.on_rest_post("/rest/process_query", Query, QueryResponse)
+@metrics.traced("/rest/process_query")
+async def process_query(ctx: Context, req: Query) -> QueryResponse:
+    prepared = await prepare_query(ctx.logger, req)
+    answer = prepared.answer
+    if answer is None:
+        answer = await query_asi(prepared.context, req.query, prepared.files, prepared.context_hash)
 
     return QueryResponse(
-        text="Query processed successfully",
+        text=prepared.text,
         agent_address=ctx.agent.address,
         answer=answer,
         timestamp=int(time.time())
     )
 
+# === Streaming Endpoint ===
+# uAgents REST handlers return a single JSON body, so streamed answers are
+# served by a small aiohttp app on its own port. POST the same body as
+# /rest/process_query to /stream/process_query and read server-sent events:
+# {"token": ...} for each piece of the answer, then {"done": true, "text": ...}.
+STREAM_PORT = int(os.getenv("QUERY_STREAM_PORT", "8011"))
+stream_runner = None
+
+async def stream_asi(context: str, query: str, files: list[str], context_hash: Optional[str] = None):
+    key = llm_cache.make_key(context_hash or llm_cache.content_hash(context), PROMPT_TEMPLATE, asi_client.ASI_MODEL, query)
+    cached = await answer_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    tokens = []
+    try:
+        async for token in asi_client.stream_chat_completion(PROMPT_TEMPLATE.format(context=context, query=query)):
+            tokens.append(token)
+            yield token
+    except asi_client.ASIError as e:
+        yield f"Error from ASI API: {e}"
+        return
+    except Exception as e:
+        yield f"Exception during ASI API call: {str(e)}"
+        return
+
+    # Only complete answers are cached; a dropped client never gets here
+    await answer_cache.set(key, "".join(tokens), files)
+
+async def send_event(response: web.StreamResponse, payload):
+    await response.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+async def stream_process_query(request: web.Request) -> web.StreamResponse:
+    logger = request.app["logger"]
+    try:
+        req = Query(**(await request.json()))
+    except Exception as e:
+        return web.json_response({"error": f"Invalid request: {e}"}, status=400)
+
+    with metrics.request_trace("/stream/process_query", req.request_id):
+        prepared = await prepare_query(logger, req)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        try:
+            if prepared.answer is not None:
+                await send_event(response, {"token": prepared.answer})
+            else:
+                async for token in stream_asi(prepared.context, req.query, prepared.files, prepared.context_hash):
+                    await send_event(response, {"token": token})
+            await send_event(response, {"done": True, "text": prepared.text})
+            await response.write_eof()
+        except ConnectionResetError:
+            metrics.mark_error()
+            logger.info(f"Client disconnected while streaming '{req.query}'")
+    return response
+
+@agent.on_event("startup")
+async def start_stream_server(ctx: Context):
+    global stream_runner
+    app = web.Application()
+    app["logger"] = ctx.logger
+    app.router.add_post("/stream/process_query", stream_process_query)
+    stream_runner = web.AppRunner(app)
+    await stream_runner.setup()
+    await web.TCPSite(stream_runner, "0.0.0.0", STREAM_PORT).start()
+    ctx.logger.info(f"Streaming answers on port {STREAM_PORT}")
+    port = await metrics.start_http_server(8001)
+    ctx.logger.info(f"Metrics on port {port}")
+
+@agent.on_event("shutdown")
+async def close_connections(ctx: Context):
+    if stream_runner is not None:
+        await stream_runner.cleanup()
+    await asi_client.close_session()
+    await metrics.stop_http_servers()
+
 # === Run Agent ===
 if __name__ == "__main__":
     agent.run()
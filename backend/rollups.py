@@ -0,0 +1,160 @@
+# rollups.py
+import re
+import calendar
+from datetime import timedelta
+from typing import Optional
+
+from columnar_store import to_float
+
+# Daily, weekly and monthly summaries of each statement, built in the same pass
+# that writes its transactions and stored on the statement's TXT document as
+# "rollups". Re-uploading a statement rebuilds only that statement's rollups;
+# summaries spanning several statements are rendered per statement at query
+# time. Questions that ask for a daily, weekly or monthly view ("monthly trend",
+# "spending per week") get that level alongside the retrieved chunks.
+
+LEVELS = ("day", "week", "month")
+TOP_DESCRIPTIONS = 3
+
+LEVEL_PATTERNS = [
+    ("day", re.compile(r"\b(daily|per day|each day|by day|day by day|day-wise|day wise)\b")),
+    ("week", re.compile(r"\b(weekly|per week|each week|by week|week by week|week-wise|week wise)\b")),
+    ("month", re.compile(r"\b(monthly|per month|each month|by month|month by month|month-wise|month wise|"
+                         r"month on month|month-on-month|trends?|over time)\b")),
+]
+
+# A named merchant, payee or description ("on swiggy", "to 'rent'") needs the
+# matching transactions themselves, which rollups only keep the top few of
+NOT_ENTITIES = {"the", "my", "a", "an", "each", "every", "per", "all", "this", "that", "last", "past",
+                "previous", "next", "day", "week", "month", "year", "time", "average"}
+NOT_ENTITIES.update(name.lower() for name in calendar.month_name if name)
+NOT_ENTITIES.update(name.lower() for name in calendar.month_abbr if name)
+ENTITY_PATTERN = re.compile(r"\b(?:on|at|to|from|for|with)\s+([a-z&@][a-z0-9&@'._-]+)|(?:^|\s)[\"'][^\"']+[\"']")
+
+def names_entity(question: str) -> bool:
+    for match in ENTITY_PATTERN.finditer(question):
+        if match.group(1) is None or match.group(1) not in NOT_ENTITIES:
+            return True
+    return False
+
+def choose_level(question: str) -> Optional[str]:
+    # The level the question explicitly asks for, or None when the question
+    # needs individual transactions
+    q = question.lower()
+    if names_entity(q):
+        return None
+    for level, pattern in LEVEL_PATTERNS:
+        if pattern.search(q):
+            return level
+    return None
+
+def new_bucket():
+    return {
+        "debit_total": 0.0,
+        "debit_count": 0,
+        "credit_total": 0.0,
+        "credit_count": 0,
+        "opening_balance": None,
+        "closing_balance": None,
+        "descriptions": {},
+    }
+
+def merge_bucket(target, source):
+    target["debit_total"] += source["debit_total"]
+    target["debit_count"] += source["debit_count"]
+    target["credit_total"] += source["credit_total"]
+    target["credit_count"] += source["credit_count"]
+    if target["opening_balance"] is None:
+        target["opening_balance"] = source["opening_balance"]
+    if source["closing_balance"] is not None:
+        target["closing_balance"] = source["closing_balance"]
+    for description, amount in source["descriptions"].items():
+        target["descriptions"][description] = target["descriptions"].get(description, 0.0) + amount
+
+def finish_bucket(period: str, bucket):
+    top = sorted(bucket["descriptions"].items(), key=lambda item: item[1], reverse=True)[:TOP_DESCRIPTIONS]
+    return {
+        "period": period,
+        "debit_total": round(bucket["debit_total"], 2),
+        "debit_count": bucket["debit_count"],
+        "credit_total": round(bucket["credit_total"], 2),
+        "credit_count": bucket["credit_count"],
+        "opening_balance": bucket["opening_balance"],
+        "closing_balance": bucket["closing_balance"],
+        "top_descriptions": [{"description": d, "debit": round(a, 2)} for d, a in top],
+    }
+
+class RollupBuilder:
+    # Fed typed transaction rows in statement order; only per-day accumulators
+    # are kept, weeks and months are folded from them in build()
+    def __init__(self):
+        self.days = {}
+
+    def add(self, row):
+        date = row.get("date")
+        if date is None:
+            return
+        day = date.date()
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = new_bucket()
+
+        debit = to_float(row.get("debit")) or 0.0
+        credit = to_float(row.get("credit")) or 0.0
+        balance = to_float(row.get("balance"))
+        if debit > 0:
+            bucket["debit_total"] += debit
+            bucket["debit_count"] += 1
+            # Table cells keep their line breaks; one period must stay on one line
+            description = " ".join((row.get("description") or "").split()) or "No description"
+            bucket["descriptions"][description] = bucket["descriptions"].get(description, 0.0) + debit
+        if credit > 0:
+            bucket["credit_total"] += credit
+            bucket["credit_count"] += 1
+        if balance is not None:
+            if bucket["opening_balance"] is None:
+                # Balance before this day's first transaction
+                bucket["opening_balance"] = round(balance + debit - credit, 2)
+            bucket["closing_balance"] = balance
+
+    def build(self):
+        rollups = {level: {} for level in LEVELS}
+        for day in sorted(self.days):
+            keys = {
+                "day": day.strftime("%Y-%m-%d"),
+                "week": (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d"),
+                "month": day.strftime("%Y-%m"),
+            }
+            for level, key in keys.items():
+                bucket = rollups[level].get(key)
+                if bucket is None:
+                    bucket = rollups[level][key] = new_bucket()
+                merge_bucket(bucket, self.days[day])
+        return {
+            level: [finish_bucket(period, bucket) for period, bucket in buckets.items()]
+            for level, buckets in rollups.items()
+        }
+
+LEVEL_TITLES = {"day": "Daily", "week": "Weekly (weeks start Monday)", "month": "Monthly"}
+
+def amount(value) -> str:
+    return "n/a" if value is None else f"{value:,.2f}"
+
+def render(rollups_by_file, level: str) -> str:
+    # rollups_by_file maps TXT filename -> rollups dict as stored by fetch_agent
+    sections = []
+    for filename, rollups in rollups_by_file.items():
+        lines = [
+            f"{LEVEL_TITLES[level]} summary of statement {filename} "
+            "(period | debits total (count) | credits total (count) | opening -> closing balance | top debits):"
+        ]
+        for bucket in rollups.get(level, []):
+            # Rollups stored before descriptions were normalised may still hold newlines
+            top = "; ".join(f"{' '.join(d['description'].split())} {amount(d['debit'])}" for d in bucket["top_descriptions"])
+            lines.append(
+                f"{bucket['period']} | {amount(bucket['debit_total'])} ({bucket['debit_count']}) | "
+                f"{amount(bucket['credit_total'])} ({bucket['credit_count']}) | "
+                f"{amount(bucket['opening_balance'])} -> {amount(bucket['closing_balance'])} | {top or '-'}"
+            )
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
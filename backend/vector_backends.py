@@ -0,0 +1,209 @@
+# vector_backends.py
+import os
+import math
+
+import faiss
+import numpy as np
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+# Configurable sentence encoders and FAISS index types for the embedding agent.
+#
+# EMBEDDING_BACKEND picks the encoder. Switching it changes the vector space,
+# so the embedding agent re-embeds everything on its next sync.
+#
+# FAISS_INDEX_TYPE picks the index:
+#   flat  - exact inner product search (default)
+#   hnsw  - graph index; FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH
+#   ivf   - inverted lists over exact vectors; FAISS_IVF_NLIST (0 = auto), FAISS_IVF_NPROBE
+#   ivfpq - inverted lists over product-quantized codes; plus FAISS_PQ_M, FAISS_PQ_NBITS
+# IVF types need training data. Until there are enough vectors the index stays
+# flat and is converted once it has grown large enough; a full rebuild
+# (embedding_agent.py --rebuild) retrains on the whole corpus.
+#
+# Every index keeps the embedding agent's stable 64-bit vector IDs: flat and
+# HNSW through IndexIDMap2, IVF types natively.
+
+ENCODERS = {
+    "mpnet": {"model_name": "sentence-transformers/all-mpnet-base-v2"},
+    "minilm": {"model_name": "sentence-transformers/all-MiniLM-L6-v2"},
+    "minilm-onnx-int8": {
+        "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+        "model_kwargs": {
+            "backend": "onnx",
+            "model_kwargs": {"file_name": os.getenv("ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")}
+        },
+    },
+}
+ENCODER_NAME = os.getenv("EMBEDDING_BACKEND", "mpnet")
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+
+INDEX_PARAMS = {
+    "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),
+    "hnsw_ef_construction": int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "80")),
+    "hnsw_ef_search": int(os.getenv("FAISS_HNSW_EF_SEARCH", "64")),
+    "ivf_nlist": int(os.getenv("FAISS_IVF_NLIST", "0")),
+    "ivf_nprobe": int(os.getenv("FAISS_IVF_NPROBE", "8")),
+    "pq_m": int(os.getenv("FAISS_PQ_M", "16")),
+    "pq_nbits": int(os.getenv("FAISS_PQ_NBITS", "8")),
+}
+
+# faiss recommends ~39 training points per IVF list
+TRAINING_POINTS_PER_LIST = 39
+
+def load_encoder(name: str = ENCODER_NAME) -> HuggingFaceEmbeddings:
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown embedding backend '{name}', expected one of {sorted(ENCODERS)}")
+    return HuggingFaceEmbeddings(**ENCODERS[name])
+
+def check_index_type(kind: str):
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {INDEX_TYPES}")
+
+def index_kind(index) -> str:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def ivf_nlist(count: int, params) -> int:
+    limit = max(1, count // TRAINING_POINTS_PER_LIST)
+    if params["ivf_nlist"] > 0:
+        return min(params["ivf_nlist"], limit)
+    return max(1, min(int(4 * math.sqrt(count)), limit))
+
+def can_train(kind: str, count: int, params) -> bool:
+    if kind == "ivf":
+        return count >= TRAINING_POINTS_PER_LIST
+    if kind == "ivfpq":
+        return count >= max(TRAINING_POINTS_PER_LIST, 1 << params["pq_nbits"])
+    return True
+
+def build_index(ids: np.ndarray, vectors: np.ndarray, kind: str = INDEX_TYPE, params=None):
+    # A new index of the requested kind holding the given vectors, or a flat
+    # one when there is not enough data to train it yet
+    check_index_type(kind)
+    params = params or INDEX_PARAMS
+    dim = vectors.shape[1]
+    if not can_train(kind, len(vectors), params):
+        kind = "flat"
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params["hnsw_ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        nlist = ivf_nlist(len(vectors), params)
+        codes = "Flat" if kind == "ivf" else f"PQ{params['pq_m']}x{params['pq_nbits']}"
+        index = faiss.index_factory(dim, f"IVF{nlist},{codes}", faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        # Lets vectors be reconstructed by ID
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    configure_search(index, params)
+    return index
+
+def configure_search(index, params=None):
+    params = params or INDEX_PARAMS
+    kind = index_kind(index)
+    if kind == "hnsw":
+        faiss.ParameterSpace().set_index_parameter(index, "efSearch", params["hnsw_ef_search"])
+    elif kind in ("ivf", "ivfpq"):
+        faiss.ParameterSpace().set_index_parameter(index, "nprobe", params["ivf_nprobe"])
+
+def search(index, queries: np.ndarray, k: int, exclude_ranges=()):
+    # index.search, skipping IDs in any of the [start, end) ranges inside the
+    # search itself, so excluded vectors never take the place of live hits
+    ranges = list(exclude_ranges)
+    if not ranges:
+        return index.search(queries, k)
+    # Python must hold every selector; faiss only keeps raw pointers
+    selectors = [faiss.IDSelectorRange(start, end) for start, end in ranges]
+    excluded = selectors[0]
+    for selector in selectors[1:]:
+        excluded = faiss.IDSelectorOr(excluded, selector)
+        selectors.append(excluded)
+    keep = faiss.IDSelectorNot(excluded)
+    kind = index_kind(index)
+    if kind in ("ivf", "ivfpq"):
+        params = faiss.SearchParametersIVF(sel=keep, nprobe=faiss.extract_index_ivf(index).nprobe)
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=keep, efSearch=faiss.downcast_index(index.index).hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=keep)
+    return index.search(queries, k, params=params)
+
+def stored_ids(index) -> np.ndarray:
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+    invlists = faiss.extract_index_ivf(index).invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+        for list_no in range(invlists.nlist)
+        if invlists.list_size(list_no)
+    ]
+    return np.concatenate(ids).astype("int64") if ids else np.empty(0, dtype="int64")
+
+def stored_vectors(index):
+    # (ids, vectors) currently held by the index; lossy for ivfpq
+    ids = stored_ids(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return ids, index.index.reconstruct_n(0, index.index.ntotal)
+    if not len(ids):
+        return ids, np.empty((0, index.d), dtype="float32")
+    return ids, np.vstack([index.reconstruct(int(i)) for i in ids]).astype("float32")
+
+def remove_ranges(index, ranges):
+    # Returns the index without IDs in any of the [start, end) ranges
+    ranges = list(ranges)
+    kind = index_kind(index)
+    if kind == "flat":
+        for start, end in ranges:
+            index.remove_ids(faiss.IDSelectorRange(start, end))
+        return index
+
+    ids = stored_ids(index)
+    in_range = np.zeros(len(ids), dtype=bool)
+    for start, end in ranges:
+        in_range |= (ids >= start) & (ids < end)
+    if not in_range.any():
+        return index
+    if kind == "hnsw":
+        # HNSW graphs cannot delete in place; rebuild once from the remaining vectors
+        ids, vectors = stored_vectors(index)
+        return build_index(ids[~in_range], vectors[~in_range], "hnsw")
+    # The IVF ID hashtable only supports removal by explicit ID list
+    doomed = np.ascontiguousarray(ids[in_range])
+    index.remove_ids(faiss.IDSelectorArray(len(doomed), faiss.swig_ptr(doomed)))
+    return index
+
+def remove_range(index, start: int, end: int):
+    return remove_ranges(index, [(start, end)])
+
+def add_vectors(index, ids: np.ndarray, vectors: np.ndarray, kind: str = INDEX_TYPE):
+    if index is None:
+        return build_index(ids, vectors, kind)
+    index.add_with_ids(vectors, ids)
+    return index
+
+def convert(index, kind: str = INDEX_TYPE, force: bool = False):
+    # Moves an index to the configured kind once it can be trained. With
+    # force, trained kinds are retrained on everything the index holds.
+    current = index_kind(index)
+    if current == kind and not (force and kind in ("ivf", "ivfpq")):
+        return index
+    if not can_train(kind, index.ntotal, INDEX_PARAMS):
+        return index
+    ids, vectors = stored_vectors(index)
+    print(f"[INFO] Converting {current} index with {len(ids)} vectors to {kind}.")
+    return build_index(ids, vectors, kind)
@@ -0,0 +1,82 @@
+# bench_concurrency.py
+# Fires concurrent requests at a running agent endpoint and reports throughput
+# and latency percentiles per concurrency level, e.g.
+#
+#   python bench_concurrency.py --url http://localhost:8001/rest/process_query \
+#       --body '{"query": "How much did I spend?", "path": "bank.txt"}' --levels 1 4 16
+#
+# Run it once against the agents before a change and once after, and compare
+# the JSON lines it prints.
+#
+# Moving the ASI call off the event loop (async client instead of a blocking
+# requests.post in the handler), measured on /rest/process_query with a
+# one-chunk body, the ASI API replaced by stub_asi.py --latency 0.5 and 4
+# requests per worker:
+#
+#   concurrency   before: rps  p50 ms    after: rps  p50 ms
+#   1                    1.97     507          1.98     505
+#   4                    1.98    2024          7.86     508
+#   16                   1.97    8083         30.87     512
+#
+# Before, requests queued behind each other's ASI call; after, throughput
+# scales with concurrency at a flat p50. The Mongo-backed path (path instead
+# of chunks) was not measured, as no MongoDB server was available.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import aiohttp
+
+async def timed_post(session, url, body):
+    start = time.perf_counter()
+    async with session.post(url, json=body) as response:
+        await response.read()
+        ok = response.status == 200
+    return time.perf_counter() - start, ok
+
+async def run_level(url, body, concurrency, requests_per_worker):
+    latencies = []
+    errors = 0
+
+    async def worker(session):
+        nonlocal errors
+        for _ in range(requests_per_worker):
+            elapsed, ok = await timed_post(session, url, body)
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_rps": round(len(latencies) / wall, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--body", default="{}", help="JSON request body")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=4, help="Requests per concurrent worker")
+    args = parser.parse_args()
+
+    body = json.loads(args.body)
+    for level in args.levels:
+        print(json.dumps(await run_level(args.url, body, level, args.requests)))
+
+if __name__ == "__main__":
+    asyncio.run(main())
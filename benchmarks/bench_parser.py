@@ -0,0 +1,103 @@
+# bench_parser.py
+# Compares the per-row table conversion in fetch_agent before and after the
+# layout schema cache, on the statements in sample_pdfs/ by default, e.g.
+#
+#   python bench_parser.py --repeat 20
+#   python bench_parser.py ../sample_pdfs/bank.pdf --repeat 5
+#
+# "legacy" maps headers for every table and runs normalize_row() followed by
+# standardize_row(), which tries each date format in turn. "schema" is the
+# cached LayoutSchema.convert() path used by iter_table_rows(). Raw tables are
+# extracted once up front so the conversion numbers are not dominated by
+# pdfplumber; the end_to_end line includes extraction. Prints JSON lines.
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import fetch_agent  # noqa: E402
+
+def legacy_rows(tables):
+    headers = None
+    for table in tables:
+        if not table:
+            continue
+        if headers is None or fetch_agent.is_header_row(table[0]):
+            headers = [fetch_agent.map_column_name(col or "") for col in table[0]]
+            body = table[1:]
+        else:
+            body = table
+        for row in body:
+            yield fetch_agent.standardize_row(fetch_agent.normalize_row(headers, row))
+
+def schema_rows(tables):
+    schema = None
+    for table in tables:
+        if not table:
+            continue
+        header_schema = fetch_agent.schema_for_header(table[0])
+        if header_schema is not None:
+            schema = header_schema
+            body = table[1:]
+        elif schema is None:
+            schema = fetch_agent.LayoutSchema([fetch_agent.map_column_name(col or "") for col in table[0]])
+            body = table[1:]
+        else:
+            body = table
+        for row in body:
+            yield schema.convert(row)
+
+def raw_tables(path):
+    tables = []
+    for page_tables in fetch_agent.iter_page_tables(path, 1):
+        tables.extend(page_tables)
+    return tables
+
+def measure(label, convert, tables, repeat):
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _ in convert(tables):
+            rows += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "path": label,
+        "rows": rows,
+        "seconds": round(elapsed, 4),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="*", default=sorted(glob.glob(os.path.join(ROOT, "sample_pdfs", "*.pdf"))))
+    parser.add_argument("--repeat", type=int, default=20, help="Conversion passes over each file's tables")
+    args = parser.parse_args()
+
+    for pdf in args.pdfs:
+        tables = raw_tables(pdf)
+        legacy = list(legacy_rows(tables))
+        schema = list(schema_rows(tables))
+        for name, convert in (("legacy", legacy_rows), ("schema", schema_rows)):
+            result = measure(name, convert, tables, args.repeat)
+            result.update(file=os.path.basename(pdf), stage="convert", identical=legacy == schema)
+            print(json.dumps(result))
+
+        start = time.perf_counter()
+        rows = sum(1 for _ in fetch_agent.iter_table_rows(pdf, workers=1))
+        elapsed = time.perf_counter() - start
+        print(json.dumps({
+            "file": os.path.basename(pdf),
+            "stage": "end_to_end",
+            "path": "schema",
+            "rows": rows,
+            "seconds": round(elapsed, 4),
+            "rows_per_s": round(rows / elapsed, 1) if elapsed else None,
+        }))
+
+if __name__ == "__main__":
+    main()
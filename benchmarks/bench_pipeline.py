@@ -0,0 +1,380 @@
+# bench_pipeline.py
+# End-to-end benchmark of the statement pipeline on synthetic PDFs, e.g.
+#
+#   python bench_pipeline.py --rows 200 2000 --output results.json
+#   python bench_pipeline.py --rows 200 2000 --output new.json --compare results.json
+#
+# Stages timed in-process, per layout and size:
+#   generate_pdf, extract_table_from_pdf, standardize_json,
+#   extract_transactions_text, chunking, embedding, index_build,
+#   fetch_pipeline (Mongo + Parquet writes), index_files, search_documents
+# and over HTTP against agents started with launcher.py (unless --no-rest):
+#   rest_process_pdf, rest_list_files, rest_retrieve_closest,
+#   rest_process_query_aggregate, rest_process_query_llm,
+#   stream_first_token, stream_complete, rest_native_chart
+#
+# Everything runs offline. Mongo is a throwaway mongod started on a temporary
+# directory (--mongod, found on PATH by default) or an existing scratch server
+# given with --mongo-uri; without either, in-process stages fall back to
+# mongomock and REST stages are skipped. ASI is replaced by stub_asi.py with a
+# fixed latency. Statement data, the layout cache, Parquet files and the local
+# index copy all live in a temporary directory.
+#
+# Each result is printed as a JSON line; --output writes the whole run to one
+# JSON file and --compare prints p50 changes against an earlier one.
+import argparse
+import base64
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+
+import statement_pdf  # noqa: E402
+import stub_asi  # noqa: E402
+
+REST_AGENTS = ["fetch", "embedding", "query", "chart"]
+LAUNCHER_READY_URL = "http://localhost:8010/ready"
+FETCH_URL = "http://localhost:8000/rest/process_pdf"
+LIST_URL = "http://localhost:8002/rest/list_files"
+RETRIEVE_URL = "http://localhost:8002/rest/retrieve_closest"
+QUERY_URL = "http://localhost:8001/rest/process_query"
+STREAM_URL = "http://localhost:8011/stream/process_query"
+CHART_URL = "http://localhost:8003/rest/native_chart"
+
+SEARCH_QUERIES = [
+    "salary credited", "food delivery orders", "amazon purchases", "rent payment",
+    "atm cash withdrawal", "electricity bill", "upi transfer to friend", "netflix subscription",
+    "train tickets", "interest credited",
+]
+AGGREGATE_QUESTION = "How much did I spend in total?"
+LLM_QUESTION = "Which merchants do I pay most often?"
+
+# ------------------- Results -------------------
+
+def summarize(stage: str, samples, **labels):
+    samples = sorted(samples)
+    result = {
+        "stage": stage,
+        **labels,
+        "n": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3),
+        "p50_ms": round(1000 * samples[len(samples) // 2], 3),
+        "p95_ms": round(1000 * samples[int(0.95 * (len(samples) - 1))], 3),
+        "min_ms": round(1000 * samples[0], 3),
+        "max_ms": round(1000 * samples[-1], 3),
+    }
+    print(json.dumps(result), flush=True)
+    return result
+
+def skipped(stage: str, reason: str):
+    result = {"stage": stage, "skipped": reason}
+    print(json.dumps(result), flush=True)
+    return result
+
+def timed(fn, repeat: int = 1):
+    samples = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        samples.append(time.perf_counter() - start)
+    return value, samples
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def result_key(result):
+    return (result["stage"], result.get("layout"), result.get("rows"))
+
+def compare(previous_path: str, results):
+    with open(previous_path) as f:
+        previous = {result_key(r): r for r in json.load(f)["results"] if "p50_ms" in r}
+    for result in results:
+        before = previous.get(result_key(result))
+        if not before or "p50_ms" not in result:
+            continue
+        change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else None
+        print(json.dumps({
+            "compare": result["stage"],
+            "layout": result.get("layout"),
+            "rows": result.get("rows"),
+            "previous_p50_ms": before["p50_ms"],
+            "p50_ms": result["p50_ms"],
+            "change_pct": round(change, 1) if change is not None else None,
+        }))
+
+# ------------------- Local stand-ins -------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def port_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+def start_mongod(mongod: str, workdir: str):
+    port = free_port()
+    dbpath = os.path.join(workdir, "mongo")
+    os.makedirs(dbpath)
+    process = subprocess.Popen(
+        [mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while not port_open(port):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("mongod did not start")
+        time.sleep(0.1)
+    return process, f"mongodb://127.0.0.1:{port}"
+
+def configure_env(workdir: str, mongo_uri, asi_port: int):
+    # Must run before any backend module is imported
+    os.environ.update({
+        "ASI_URL": f"http://127.0.0.1:{asi_port}/v1/chat/completions",
+        "ASI_API_KEY": "stub",
+        "COLUMNAR_DIR": os.path.join(workdir, "columnar"),
+        "FAISS_INDEX_DIR": os.path.join(workdir, "index_cache"),
+        "LAYOUT_CACHE_PATH": os.path.join(workdir, "layout_cache.json"),
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    })
+    if mongo_uri:
+        os.environ["MONGODB_URI"] = mongo_uri
+
+def use_mongomock():
+    import mongomock
+    import mongomock.gridfs
+    import db
+
+    mongomock.gridfs.enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    db.get_client = lambda: client
+
+# ------------------- In-process stages -------------------
+
+def run_in_process(args, run_id: str, pdfs):
+    import fetch_agent
+    import embedding_agent
+    import vector_backends
+
+    # The embedding step is timed on its own below
+    fetch_agent.notify_embedding_agent = lambda filenames: None
+    fetch_agent.ensure_indexes()
+
+    results = []
+    _, samples = timed(embedding_agent.get_embeddings)
+    results.append(summarize("model_load", samples, encoder=vector_backends.ENCODER_NAME))
+
+    for (layout, rows), pdf_bytes in pdfs.items():
+        labels = {"layout": layout, "rows": rows}
+        table, samples = timed(lambda: fetch_agent.extract_table_from_pdf(pdf_bytes), args.repeat)
+        results.append(summarize("extract_table_from_pdf", samples, **labels, parsed_rows=len(table)))
+
+        standardized, samples = timed(lambda: fetch_agent.standardize_json(table), args.repeat)
+        results.append(summarize("standardize_json", samples, **labels))
+
+        narration, samples = timed(lambda: fetch_agent.extract_transactions_text(standardized), args.repeat)
+        results.append(summarize("extract_transactions_text", samples, **labels))
+
+        chunks, samples = timed(
+            lambda: [embedding_agent.preprocess_text(c) for c in embedding_agent.splitter.split_text(narration)],
+            args.repeat
+        )
+        results.append(summarize("chunking", samples, **labels, chunks=len(chunks)))
+
+        vectors, samples = timed(lambda: embedding_agent.get_embeddings().embed_documents(chunks))
+        results.append(summarize("embedding", samples, **labels, chunks=len(chunks)))
+        vectors = np.array(vectors, dtype="float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        ids = np.arange(len(vectors), dtype="int64")
+        _, samples = timed(lambda: vector_backends.build_index(ids, vectors), args.repeat)
+        results.append(summarize("index_build", samples, **labels, index_type=vector_backends.INDEX_TYPE))
+
+        filename = f"bench_{layout}_{rows}_{run_id}.pdf"
+        encoded = base64.b64encode(pdf_bytes).decode("utf-8")
+        _, samples = timed(lambda: fetch_agent.full_pipeline(encoded, filename))
+        results.append(summarize("fetch_pipeline", samples, **labels))
+
+        txt_filename = f"{filename.rsplit('.', 1)[0]}.txt"
+        _, samples = timed(lambda: embedding_agent.index_files([txt_filename]))
+        results.append(summarize("index_files", samples, **labels))
+
+    # Searches run against everything indexed above
+    embedding_agent.search_documents(SEARCH_QUERIES[0], args.top_k)
+    samples = [timed(lambda: embedding_agent.search_documents(q, args.top_k))[1][0] for q in SEARCH_QUERIES]
+    results.append(summarize("search_documents", samples, top_k=args.top_k))
+    return results
+
+# ------------------- REST round trips -------------------
+
+def wait_until_ready(timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(LAUNCHER_READY_URL, timeout=2).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def timed_post(url: str, body, timeout: float = 600):
+    start = time.perf_counter()
+    response = requests.post(url, json=body, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return response.json(), elapsed
+
+def stream_timings(body):
+    start = time.perf_counter()
+    first = None
+    with requests.post(STREAM_URL, json=body, stream=True, timeout=600) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:") and first is None:
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+def run_rest(args, run_id: str, pdfs, workdir: str):
+    log_path = os.path.join(workdir, "agents.log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "launcher.py", "--agents", *REST_AGENTS],
+            cwd=BACKEND, env=os.environ.copy(), stdout=log, stderr=subprocess.STDOUT
+        )
+    results = []
+    try:
+        if not wait_until_ready(args.timeout):
+            return [skipped("rest", f"agents not ready after {args.timeout}s, see {log_path}")]
+
+        paths = []
+        for (layout, rows), pdf_bytes in pdfs.items():
+            filename = f"rest_{layout}_{rows}_{run_id}.pdf"
+            body = {"text": base64.b64encode(pdf_bytes).decode("utf-8"), "filename": filename}
+            _, elapsed = timed_post(FETCH_URL, body)
+            results.append(summarize("rest_process_pdf", [elapsed], layout=layout, rows=rows))
+            paths.append(f"{filename.rsplit('.', 1)[0]}.txt")
+
+        samples = [timed_post(LIST_URL, {})[1] for _ in range(args.repeat)]
+        results.append(summarize("rest_list_files", samples))
+
+        samples = [timed_post(RETRIEVE_URL, {"query": q, "top_k": args.top_k})[1] for q in SEARCH_QUERIES]
+        results.append(summarize("rest_retrieve_closest", samples, top_k=args.top_k))
+
+        path = paths[-1]
+        samples = [timed_post(QUERY_URL, {"query": AGGREGATE_QUESTION, "path": path})[1] for _ in range(args.repeat)]
+        results.append(summarize("rest_process_query_aggregate", samples))
+
+        # A fresh question each time so the answer cache does not hide ASI
+        samples = [
+            timed_post(QUERY_URL, {"query": f"{LLM_QUESTION} ({i})", "path": path})[1]
+            for i in range(args.repeat)
+        ]
+        results.append(summarize("rest_process_query_llm", samples, asi_latency_s=args.asi_latency))
+
+        timings = [stream_timings({"query": f"{LLM_QUESTION} [stream {i}]", "path": path}) for i in range(args.repeat)]
+        results.append(summarize("stream_first_token", [t[0] for t in timings if t[0] is not None]))
+        results.append(summarize("stream_complete", [t[1] for t in timings]))
+
+        for kind in ("balance_trend", "credit_debit", "expense_income"):
+            samples = [timed_post(CHART_URL, {"path": path, "kind": kind})[1] for _ in range(args.repeat)]
+            results.append(summarize("rest_native_chart", samples, kind=kind))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return results
+
+# ------------------- Main -------------------
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[200, 2000], help="Transactions per statement")
+    parser.add_argument("--layouts", nargs="+", choices=sorted(statement_pdf.LAYOUTS), default=sorted(statement_pdf.LAYOUTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mongo-uri", help="Scratch Mongo server to use instead of starting mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary for the throwaway server")
+    parser.add_argument("--asi-latency", type=float, default=0.2, help="Stub ASI seconds per completion")
+    parser.add_argument("--no-rest", action="store_true", help="Only run the in-process stages")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the agents")
+    parser.add_argument("--output", help="Write the whole run to this JSON file")
+    parser.add_argument("--compare", help="Earlier --output file to compare p50 latencies with")
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    workdir = tempfile.mkdtemp(prefix="frosthack_bench_")
+    mongod_process = None
+    asi_port = free_port()
+    stub_asi.serve_in_thread(asi_port, latency=args.asi_latency)
+
+    try:
+        mongo_uri = args.mongo_uri
+        if not mongo_uri and shutil.which(args.mongod):
+            mongod_process, mongo_uri = start_mongod(shutil.which(args.mongod), workdir)
+        configure_env(workdir, mongo_uri, asi_port)
+        if not mongo_uri:
+            use_mongomock()
+
+        pdfs = {}
+        results = []
+        for layout in args.layouts:
+            for rows in args.rows:
+                pdfs[(layout, rows)], samples = timed(lambda: statement_pdf.statement_pdf(layout, rows, seed=rows))
+                results.append(summarize("generate_pdf", samples, layout=layout, rows=rows, bytes=len(pdfs[(layout, rows)])))
+
+        results.extend(run_in_process(args, run_id, pdfs))
+        if args.no_rest:
+            pass
+        elif not mongo_uri:
+            results.append(skipped("rest", "needs a real Mongo server (mongod on PATH or --mongo-uri)"))
+        else:
+            results.extend(run_rest(args, run_id, pdfs, workdir))
+    finally:
+        if mongod_process is not None:
+            mongod_process.terminate()
+            mongod_process.wait(timeout=30)
+
+    run = {
+        "run_id": run_id,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "mongo": "mongomock" if not mongo_uri else ("mongod" if mongod_process else "external"),
+        "args": vars(args),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"run": run, "results": results}, f, indent=2)
+    if args.compare:
+        compare(args.compare, results)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench_startup.py
+# Compares cold start of the five-process layout with backend/launcher.py
+# hosting every agent in one process, e.g.
+#
+#   python bench_startup.py --layouts separate launcher
+#   python bench_startup.py --agents fetch query chart delete
+#
+# For each layout it reports the time until every agent port accepts
+# connections, the time until the first /rest/retrieve_closest answer (which
+# needs the embedding model, so only when the embedding agent is included),
+# and the total resident memory of all processes at that point. Needs
+# MONGODB_URI like the agents themselves. Prints JSON lines.
+#
+# Measured with --agents fetch query chart delete (three runs each, MongoDB
+# unreachable so start-up index creation fails fast):
+#
+#   layout      processes  all ports listening  total RSS
+#   separate    4          5.1 - 6.1 s          668 MB
+#   launcher    1          1.5 - 1.7 s          199 MB
+#
+# The embedding agent was not included: run standalone it needs MongoDB before
+# it listens, and the sentence-transformers model could not be downloaded, so
+# the time to first search and the saving from one shared model are unmeasured.
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+# name -> (script, REST port), as in launcher.AGENTS
+AGENTS = {
+    "fetch": ("fetch_agent.py", 8000),
+    "query": ("query_agent.py", 8001),
+    "embedding": ("embedding_agent.py", 8002),
+    "chart": ("chart_agent.py", 8003),
+    "delete": ("delete_agent.py", 8005),
+}
+SEARCH_URL = "http://localhost:8002/rest/retrieve_closest"
+
+def port_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+def process_tree_rss_mb(pid: int) -> float:
+    # VmRSS of pid and all its descendants (worker pools included)
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+def start_layout(layout: str, names):
+    if layout == "launcher":
+        commands = [[sys.executable, "launcher.py", "--agents", *names]]
+    else:
+        commands = [[sys.executable, AGENTS[name][0]] for name in names]
+    return [
+        subprocess.Popen(command, cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for command in commands
+    ]
+
+def wait_for(predicate, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return False
+
+def first_search() -> bool:
+    try:
+        response = requests.post(SEARCH_URL, json={"query": "salary credit", "top_k": 1}, timeout=120)
+    except requests.exceptions.RequestException:
+        return False
+    return response.status_code == 200
+
+def measure(layout: str, names, timeout: float):
+    ports = [AGENTS[name][1] for name in names]
+    start = time.perf_counter()
+    processes = start_layout(layout, names)
+    try:
+        listening = wait_for(lambda: all(port_open(port) for port in ports), timeout)
+        listening_s = time.perf_counter() - start
+        searched = listening and "embedding" in names and wait_for(first_search, timeout)
+        search_s = time.perf_counter() - start
+        rss = sum(process_tree_rss_mb(p.pid) for p in processes)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return {
+        "layout": layout,
+        "agents": names,
+        "processes": len(processes),
+        "all_ports_s": round(listening_s, 3) if listening else None,
+        "first_search_s": round(search_s, 3) if searched else None,
+        "rss_mb": rss,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layouts", nargs="+", choices=["separate", "launcher"], default=["separate", "launcher"])
+    parser.add_argument("--agents", nargs="+", choices=list(AGENTS), default=list(AGENTS))
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for each stage")
+    args = parser.parse_args()
+
+    for layout in args.layouts:
+        print(json.dumps(measure(layout, args.agents, args.timeout)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# bench_vectors.py
+# Offline comparison of embedding backends and FAISS index types, e.g.
+#
+#   python bench_vectors.py --encoders mpnet minilm minilm-onnx-int8 \
+#       --index-types flat hnsw ivf ivfpq --k 8
+#   python bench_vectors.py --corpus narrations/*.txt --queries questions.txt
+#
+# The corpus is chunked like the embedding agent chunks narrations. Without
+# --corpus a synthetic statement narration of --rows transactions is used.
+# For every encoder it reports encode throughput and query encode latency; for
+# every index type, build time, search latency and recall@k against exact
+# flat search with the same encoder. Encoders after the first also report
+# recall@k of their flat results against the first encoder's, i.e. how much
+# retrieval changes by switching models. Needs no Mongo. Prints JSON lines.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from langchain.text_splitter import CharacterTextSplitter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import vector_backends  # noqa: E402
+
+CHUNK_SIZE = 600
+DEFAULT_QUERIES = [
+    "salary credited",
+    "how much did I spend on food",
+    "amazon purchases",
+    "rent payment",
+    "atm cash withdrawal",
+    "electricity bill",
+    "upi transfer to friend",
+    "largest debit",
+    "interest credited",
+    "closing balance",
+]
+DESCRIPTIONS = [
+    "UPI/SWIGGY/food order", "UPI/ZOMATO/dinner", "AMAZON PAY INDIA", "NEFT SALARY ACME CORP",
+    "ATM CASH WDL", "RENT TRANSFER", "BESCOM ELECTRICITY BILL", "INTEREST CREDIT",
+    "UPI/RAHUL/split", "NETFLIX SUBSCRIPTION", "IRCTC TICKET", "FLIPKART ORDER",
+]
+
+def synthetic_narration(rows: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    day = date(2023, 1, 1)
+    balance = 50000.0
+    lines = []
+    for _ in range(rows):
+        day += timedelta(days=rng.randint(0, 2))
+        description = rng.choice(DESCRIPTIONS)
+        if "SALARY" in description or "INTEREST" in description:
+            amount = round(rng.uniform(100, 60000), 2)
+            balance += amount
+            lines.append(f"On {day:%d-%b-%Y}, {description}: credited Rs {amount}. Balance: Rs {balance:.2f}.")
+        else:
+            amount = round(rng.uniform(50, 5000), 2)
+            balance -= amount
+            lines.append(f"On {day:%d-%b-%Y}, {description}: debited Rs {amount}. Balance: Rs {balance:.2f}.")
+    return "\n".join(lines)
+
+def load_corpus(paths, rows: int):
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    if not texts:
+        texts = [synthetic_narration(rows)]
+    splitter = CharacterTextSplitter(separator="\n", chunk_size=CHUNK_SIZE, chunk_overlap=0)
+    return [chunk.lower().replace("\n", " ").strip() for text in texts for chunk in splitter.split_text(text)]
+
+def encode(encoder, texts, batch: int = 64) -> np.ndarray:
+    vectors = []
+    for start in range(0, len(texts), batch):
+        vectors.extend(encoder.embed_documents(texts[start:start + batch]))
+    vectors = np.array(vectors, dtype="float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def recall_at_k(results: np.ndarray, truth: np.ndarray) -> float:
+    hits = 0
+    total = 0
+    for found, expected in zip(results, truth):
+        expected = set(int(i) for i in expected if i != -1)
+        hits += len(expected & set(int(i) for i in found if i != -1))
+        total += len(expected)
+    return round(hits / total, 4) if total else None
+
+def time_search(index, queries: np.ndarray, k: int):
+    # Per-query latency, as the agent mostly sees small batches
+    latencies = []
+    results = []
+    for row in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[row:row + 1], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    latencies.sort()
+    return np.array(results), {
+        "search_p50_ms": round(latencies[len(latencies) // 2] * 1000, 4),
+        "search_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoders", nargs="+", default=["mpnet", "minilm"], choices=sorted(vector_backends.ENCODERS))
+    parser.add_argument("--index-types", nargs="+", default=list(vector_backends.INDEX_TYPES), choices=vector_backends.INDEX_TYPES)
+    parser.add_argument("--corpus", nargs="*", default=[], help="Narration .txt files")
+    parser.add_argument("--rows", type=int, default=20000, help="Synthetic transactions when no corpus is given")
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    chunks = load_corpus(args.corpus, args.rows)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip().lower() for line in f if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+    ids = np.arange(len(chunks), dtype="int64")
+    reference = None
+
+    for name in args.encoders:
+        start = time.perf_counter()
+        encoder = vector_backends.load_encoder(name)
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = encode(encoder, chunks)
+        encode_s = time.perf_counter() - start
+
+        query_latencies = []
+        query_vectors = []
+        for query in queries:
+            start = time.perf_counter()
+            query_vectors.append(encode(encoder, [query])[0])
+            query_latencies.append(time.perf_counter() - start)
+        query_vectors = np.array(query_vectors, dtype="float32")
+        query_latencies.sort()
+
+        exact = vector_backends.build_index(ids, vectors, "flat")
+        truth, _ = time_search(exact, query_vectors, args.k)
+        encoder_result = {
+            "encoder": name,
+            "dim": int(vectors.shape[1]),
+            "chunks": len(chunks),
+            "load_s": round(load_s, 3),
+            "encode_chunks_per_s": round(len(chunks) / encode_s, 2),
+            "query_encode_p50_ms": round(query_latencies[len(query_latencies) // 2] * 1000, 3),
+        }
+        if reference is None:
+            reference = truth
+        else:
+            encoder_result[f"recall@{args.k}_vs_{args.encoders[0]}"] = recall_at_k(truth, reference)
+        print(json.dumps(encoder_result))
+
+        for kind in args.index_types:
+            start = time.perf_counter()
+            index = vector_backends.build_index(ids, vectors, kind)
+            build_s = time.perf_counter() - start
+            found, latency = time_search(index, query_vectors, args.k)
+            print(json.dumps({
+                "encoder": name,
+                "index_type": kind,
+                "built_as": vector_backends.index_kind(index),
+                "build_s": round(build_s, 3),
+                f"recall@{args.k}": recall_at_k(found, truth),
+                **latency,
+                "params": vector_backends.INDEX_PARAMS,
+            }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# statement_pdf.py
+# Synthetic bank statement PDFs for benchmarks. Each layout uses a header and
+# date format that fetch_agent understands (see COLUMN_MAPPINGS and
+# DATE_FORMATS), and tables are drawn with ruling lines so pdfplumber finds
+# them the same way it does in real statements. No PDF library is needed, e.g.
+#
+#   python statement_pdf.py --layout amount_type --rows 5000 -o big.pdf
+import argparse
+import random
+from datetime import date, timedelta
+
+LAYOUTS = {
+    "debit_credit": {
+        "headers": ["Date", "Description", "Debit", "Credit", "Balance"],
+        "date_format": "%d-%m-%y",
+    },
+    "withdrawal_deposit": {
+        "headers": ["Transaction Date", "Narration", "Withdrawal", "Deposit", "Closing Balance"],
+        "date_format": "%d %b %Y",
+    },
+    "amount_type": {
+        "headers": ["Posted Date", "Details", "Transaction Amount", "Type", "Balance"],
+        "date_format": "%d/%m/%Y",
+    },
+    "remarks": {
+        "headers": ["Date", "Remarks", "Amount Debited", "Amount Credited", "Final Balance"],
+        "date_format": "%d/%m/%y",
+    },
+}
+
+DESCRIPTIONS = [
+    "UPI/SWIGGY/food order", "UPI/ZOMATO/dinner", "AMAZON PAY INDIA", "ATM CASH WDL",
+    "RENT TRANSFER", "BESCOM ELECTRICITY BILL", "UPI/RAHUL/split", "NETFLIX SUBSCRIPTION",
+    "IRCTC TICKET", "FLIPKART ORDER", "MOBILE RECHARGE", "PETROL PUMP",
+]
+CREDIT_DESCRIPTIONS = ["NEFT SALARY ACME CORP", "INTEREST CREDIT", "UPI/REFUND", "IMPS FROM FRIEND"]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 25
+COLUMN_WIDTHS = [80, 210, 85, 80, 90]
+ROW_HEIGHT = 16
+FONT_SIZE = 8
+
+def generate_transactions(rows: int, seed: int = 0):
+    rng = random.Random(seed)
+    day = date(2023, 1, 1)
+    balance = 25000.0
+    transactions = []
+    for i in range(rows):
+        day += timedelta(days=rng.choice([0, 0, 1, 1, 2]))
+        if rng.random() < 0.15:
+            amount = round(rng.uniform(500, 60000), 2)
+            balance += amount
+            transactions.append({"date": day, "description": rng.choice(CREDIT_DESCRIPTIONS), "debit": 0.0, "credit": amount, "balance": balance})
+        else:
+            amount = round(rng.uniform(20, min(5000, max(balance, 20))), 2)
+            balance -= amount
+            transactions.append({"date": day, "description": rng.choice(DESCRIPTIONS), "debit": amount, "credit": 0.0, "balance": balance})
+    return transactions
+
+def money(value: float) -> str:
+    return f"{value:,.2f}" if value else ""
+
+def table_row(layout: str, txn) -> list[str]:
+    when = txn["date"].strftime(LAYOUTS[layout]["date_format"])
+    if layout == "amount_type":
+        is_credit = txn["credit"] > 0
+        amount = txn["credit"] if is_credit else txn["debit"]
+        return [when, txn["description"], money(amount), "CR" if is_credit else "DR", money(txn["balance"])]
+    return [when, txn["description"], money(txn["debit"]), money(txn["credit"]), money(txn["balance"])]
+
+def pdf_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def page_content(rows) -> bytes:
+    # rows includes the header; draws the grid, then the cell text
+    top = PAGE_HEIGHT - MARGIN
+    bottom = top - ROW_HEIGHT * len(rows)
+    right = MARGIN + sum(COLUMN_WIDTHS)
+    ops = ["0.5 w"]
+    for i in range(len(rows) + 1):
+        y = top - i * ROW_HEIGHT
+        ops.append(f"{MARGIN} {y} m {right} {y} l S")
+    x = MARGIN
+    for width in [0] + COLUMN_WIDTHS:
+        x += width
+        ops.append(f"{x} {top} m {x} {bottom} l S")
+    ops.append(f"BT /F1 {FONT_SIZE} Tf")
+    for i, row in enumerate(rows):
+        y = top - (i + 1) * ROW_HEIGHT + 5
+        x = MARGIN
+        for width, cell in zip(COLUMN_WIDTHS, row):
+            ops.append(f"1 0 0 1 {x + 3} {y} Tm ({pdf_text(cell)}) Tj")
+            x += width
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+def statement_pdf(layout: str, rows: int, seed: int = 0) -> bytes:
+    headers = LAYOUTS[layout]["headers"]
+    body = [table_row(layout, txn) for txn in generate_transactions(rows, seed)]
+    rows_per_page = (PAGE_HEIGHT - 2 * MARGIN) // ROW_HEIGHT - 1
+    pages = [body[i:i + rows_per_page] for i in range(0, len(body), rows_per_page)] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content per page
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_rows in pages:
+        content = page_content([headers] + page_rows)
+        content_id = len(objects) + 2
+        page_ids.append(len(objects) + 1)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode("latin-1")
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body_bytes in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body_bytes + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(out)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layout", choices=sorted(LAYOUTS), default="debit_credit")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="statement.pdf")
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as f:
+        f.write(statement_pdf(args.layout, args.rows, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# stub_asi.py
+# A local stand-in for the ASI chat completions API, so benchmarks run offline
+# and LLM latency is a fixed, known quantity. Point the agents at it with
+# ASI_URL=http://127.0.0.1:8090/v1/chat/completions (and any ASI_API_KEY), e.g.
+#
+#   python stub_asi.py --port 8090 --latency 0.5 --tokens 200
+#
+# Non-streaming requests answer after --latency seconds; streaming requests
+# send --tokens server-sent events spread over the same time.
+import argparse
+import asyncio
+import json
+import threading
+
+from aiohttp import web
+
+def answer_tokens(prompt: str, count: int):
+    # Deterministic filler that mentions the question, like a real answer would
+    question = prompt.rsplit("Question:", 1)[-1].strip().splitlines()[0] if "Question:" in prompt else "your question"
+    words = f"Stub answer to '{question}':".split()
+    filler = ["the", "statement", "shows", "regular", "debits", "and", "credits"]
+    while len(words) < count:
+        words.append(filler[len(words) % len(filler)])
+    return [word + " " for word in words[:count]]
+
+class StubASI:
+    def __init__(self, latency: float = 0.2, tokens: int = 100):
+        self.latency = latency
+        self.tokens = tokens
+        self.requests = 0
+
+    async def chat_completions(self, request: web.Request):
+        self.requests += 1
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        tokens = answer_tokens(prompt, self.tokens)
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.latency)
+            return web.json_response({
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(tokens)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        delay = self.latency / max(len(tokens), 1)
+        for token in tokens:
+            await asyncio.sleep(delay)
+            event = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+def serve_in_thread(port: int, latency: float = 0.2, tokens: int = 100) -> StubASI:
+    # Runs the stub on its own event loop in a daemon thread; returns once it
+    # is accepting connections
+    stub = StubASI(latency, tokens)
+    started = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(stub.app())
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait(10)
+    return stub
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per completion")
+    parser.add_argument("--tokens", type=int, default=100, help="Tokens per completion")
+    args = parser.parse_args()
+    web.run_app(StubASI(args.latency, args.tokens).app(), host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,281 @@
 import streamlit as st
 import requests
 import os
-import re
-import plotly.express as px
-import datetime
+import plotly.io as pio
 import base64
+import hashlib
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Files above this size are streamed in chunks; smaller ones are sent together
+CHUNKED_UPLOAD_THRESHOLD = 4 * 1024 * 1024
+BATCH_UPLOAD_MAX_BYTES = 16 * 1024 * 1024
+QUERY_STREAM_URL = os.getenv("QUERY_STREAM_URL", "http://localhost:8011/stream/process_query")
+FRONTEND_WORKERS = int(os.getenv("FRONTEND_WORKERS", "8"))
+# Uploads and resets made through this app invalidate cached responses right
+# away; the TTL bounds staleness from changes made directly against the agents
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "300"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+# === Shared HTTP resources ===
+# Streamlit re-executes this script on every interaction, so anything that
+# must outlive a rerun lives in st.cache_resource and is shared by all
+# sessions of this server.
+@st.cache_resource
+def http_session():
+    # Keep-alive connections to the agents instead of a new TCP connection per call
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=FRONTEND_WORKERS * 2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class ResponseCache:
+    # Backend responses keyed on the data version. invalidate() moves to a new
+    # version after an upload or reset, and a response fetched under an older
+    # version is never stored.
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, version: int, key):
+        with self.lock:
+            entry = self.entries.get((version, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[(version, key)]
+                return None
+            self.entries.move_to_end((version, key))
+            return value
+
+    def set(self, version: int, key, value):
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[(version, key)] = (value, time.time() + self.ttl)
+            self.entries.move_to_end((version, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+@st.cache_resource
+def response_cache():
+    return ResponseCache()
+
+@st.cache_resource
+def fan_out_pool():
+    # Independent agent calls from one page run here concurrently
+    return ThreadPoolExecutor(max_workers=FRONTEND_WORKERS)
+
+SESSION = http_session()
+CACHE = response_cache()
+POOL = fan_out_pool()
+
+class BackendError(Exception):
+    pass
+
+def cached_post(url, body, key, ok=lambda data: True, timeout=120):
+    # key identifies the result; body may also carry a per-action request_id.
+    # Failed calls and responses rejected by ok() are not cached.
+    version = CACHE.version
+    data = CACHE.get(version, key)
+    if data is not None:
+        return data
+    response = SESSION.post(url, json=body, timeout=timeout)
+    if response.status_code != 200:
+        raise BackendError(f"{response.status_code} - {response.text}")
+    data = response.json()
+    if ok(data):
+        CACHE.set(version, key, data)
+    return data
+
+# === Send a PDF to the fetch agent in fixed-size chunks ===
+def upload_in_chunks(uploaded_file, request_id=""):
+    upload_id = uuid.uuid4().hex
+    uploaded_file.seek(0)
+    index = 0
+    chunk = uploaded_file.read(UPLOAD_CHUNK_SIZE)
+    while True:
+        next_chunk = uploaded_file.read(UPLOAD_CHUNK_SIZE)
+        final = not next_chunk
+        response = SESSION.post(
+            "http://localhost:8000/rest/upload_chunk",
+            json={
+                "upload_id": upload_id,
+                "filename": uploaded_file.name,
+                "index": index,
+                "data": base64.b64encode(chunk).decode("utf-8"),
+                "final": final,
+                "request_id": request_id
+            },
+            timeout=300 if final else 60
+        )
+        if final or response.status_code != 200 or response.json().get("text", "").startswith("❌"):
+            return response
+        chunk = next_chunk
+        index += 1
+
+def upload_large_file(uploaded_file, request_id=""):
+    try:
+        response = upload_in_chunks(uploaded_file, request_id)
+        text = (response.json().get('text') or "") if response.status_code == 200 else response.text
+        return response.status_code == 200 and not text.startswith("❌"), text
+    except Exception as e:
+        return False, f"Failed to contact agent: {e}"
+
+# === Send many small PDFs to the fetch agent in as few requests as possible ===
+def group_batches(uploaded_files):
+    batches = []
+    batch, batch_size = [], 0
+    for uploaded_file in uploaded_files:
+        if batch and batch_size + uploaded_file.size > BATCH_UPLOAD_MAX_BYTES:
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(uploaded_file)
+        batch_size += uploaded_file.size
+    if batch:
+        batches.append(batch)
+    return batches
+
+def upload_batch(batch, request_id=""):
+    results = {}
+    try:
+        response = SESSION.post(
+            "http://localhost:8000/rest/process_pdf_batch",
+            json={"files": [
+                {"filename": f.name, "text": base64.b64encode(f.getvalue()).decode("utf-8")}
+                for f in batch
+            ], "request_id": request_id},
+            timeout=300
+        )
+        if response.status_code == 200:
+            for result in response.json().get("results", []):
+                results[result["filename"]] = (result["status"] != "error", result["text"])
+        else:
+            for f in batch:
+                results[f.name] = (False, f"{response.status_code} - {response.text}")
+    except Exception as e:
+        for f in batch:
+            results[f.name] = (False, f"Failed to contact agent: {e}")
+    return results
+
+def forget_uploads(filename=None):
+    # Lets a deleted statement (or, without a filename, every statement) be
+    # uploaded again, and empties the uploader so the files still attached to
+    # it are not re-ingested on the next rerun
+    processed = st.session_state.get("processed_uploads", {})
+    if filename is None:
+        processed.clear()
+    else:
+        base_filename = os.path.basename(filename).rsplit(".", 1)[0]
+        for file_hash, (name, _) in list(processed.items()):
+            if name.rsplit(".", 1)[0] == base_filename:
+                del processed[file_hash]
+    st.session_state["uploader_generation"] = st.session_state.get("uploader_generation", 0) + 1
 
 def upload_page():
     st.subheader("📥 Upload PDF Files to Agent")
 
-    uploaded_files = st.file_uploader("Choose one or more PDF files", type="pdf", accept_multiple_files=True)
+    # A new key empties the uploader, so files deleted from the backend are not sent again on the next rerun
+    uploader_key = f"pdf_uploader_{st.session_state.get('uploader_generation', 0)}"
+    uploaded_files = st.file_uploader("Choose one or more PDF files", type="pdf", accept_multiple_files=True, key=uploader_key)
 
     if uploaded_files:
         st.success(f"{len(uploaded_files)} file(s) ready for processing!")
-        
+
+        # Streamlit reruns this page on every interaction; only send file
+        # contents this session has not already processed (hash -> (filename, response))
+        processed = st.session_state.setdefault("processed_uploads", {})
+        hashes = {f.name: hashlib.sha256(f.getvalue()).hexdigest() for f in uploaded_files}
+        new_files = [f for f in uploaded_files if hashes[f.name] not in processed]
+
+        results = {}
+        if new_files:
+            # One request_id per user action ties the agents' [TRACE] log lines together
+            request_id = uuid.uuid4().hex
+            with st.spinner(f"🔄 Sending {len(new_files)} file(s) to backend agent..."):
+                # Small statements go together in batch requests; large ones
+                # are streamed to the agent in chunks. Batches and large files
+                # are independent, so they are all sent at once.
+                # a.pdf and a.PDF are stored under the same name, so only the first is sent
+                first_by_base = {}
+                for f in new_files:
+                    first = first_by_base.setdefault(f.name.rsplit(".", 1)[0], f.name)
+                    if first != f.name:
+                        results[f.name] = (False, f"Duplicate of {first} in this upload; upload it separately.")
+                to_send = [f for f in new_files if f.name not in results]
+                small_files = [f for f in to_send if f.size <= CHUNKED_UPLOAD_THRESHOLD]
+                large_files = [f for f in to_send if f.size > CHUNKED_UPLOAD_THRESHOLD]
+                batch_futures = [POOL.submit(upload_batch, batch, request_id) for batch in group_batches(small_files)]
+                large_futures = {f.name: POOL.submit(upload_large_file, f, request_id) for f in large_files}
+                for future in batch_futures:
+                    results.update(future.result())
+                for name, future in large_futures.items():
+                    results[name] = future.result()
+            if any(ok for ok, _ in results.values()):
+                CACHE.invalidate()
+
         for uploaded_file in uploaded_files:
             with st.expander(f"📑 {uploaded_file.name}"):
                 st.write(f"- *File Type:* {uploaded_file.type}")
                 st.write(f"- *File Size:* {uploaded_file.size / 1024:.2f} KB")
 
-                # Convert PDF to base64
-                file_bytes = uploaded_file.read()
-                encoded_pdf = base64.b64encode(file_bytes).decode("utf-8")
+                file_hash = hashes[uploaded_file.name]
+                if file_hash in processed:
+                    st.success(f"✅ Agent Response: {processed[file_hash][1]}")
+                    continue
+
+                ok, text = results.get(uploaded_file.name, (False, "No response from agent"))
+                if ok:
+                    processed[file_hash] = (uploaded_file.name, text)
+                    st.success(f"✅ Agent Response: {text}")
+                else:
+                    st.error(f"❌ Error: {text}")
 
-                # Inform user
-                st.write("🔄 Sending to backend agent...")
 
+    st.markdown("---")
+    st.subheader("🗑️ Delete a Statement")
+
+    stored_files = get_uploaded_files()
+    if stored_files:
+        to_delete = st.selectbox("Select a statement to delete:", stored_files)
+        if st.button("Delete Statement"):
+            with st.spinner(f"Deleting {to_delete}..."):
                 try:
-                    response = requests.post(
-                        "http://localhost:8000/rest/process_pdf",
-                        json={"text": encoded_pdf, "filename": uploaded_file.name},
-                        timeout=60
+                    response = SESSION.post(
+                        "http://localhost:8005/rest/delete_file",
+                        json={"filename": to_delete, "request_id": uuid.uuid4().hex},
+                        timeout=120
                     )
-                    if response.status_code == 200:
-                        st.success(f"✅ Agent Response: {response.json().get('text')}")
+                    CACHE.invalidate()
+                    data = response.json()
+                    if response.status_code == 200 and data["status"] == "success":
+                        forget_uploads(to_delete)
+                        st.success(f"✅ {data['message']}")
                     else:
-                        st.error(f"❌ Error: {response.status_code} - {response.text}")
+                        st.error(f"❌ Failed to delete statement: {data.get('message')}")
                 except Exception as e:
-                    st.error(f"🚨 Failed to contact agent: {e}")
-
+                    st.error(f"🚨 Error deleting statement: {e}")
 
     st.markdown("---")
     st.subheader("🗑️ Reset Project Data")
 
-    st.info("To maintain clean and efficient operations, we only support **batch uploads** at a time.\n\n"
-            "If you'd like to upload a new set of files, please reset the system to remove the existing files and embeddings.")
+    st.info("Deleting a single statement keeps everything else indexed. "
+            "To start over with a new set of files, reset the system to remove all files and embeddings.")
 
     # Confirm Reset Action
     confirm = st.text_input("Type `RESET` to confirm deletion of all uploads and embeddings")
@@ -53,10 +284,12 @@ def upload_page():
         if st.button("🔄 Delete All Uploads and Embeddings from Database"):
             with st.spinner("Deleting data from MongoDB..."):
                 try:
-                    response = requests.post("http://localhost:8005/rest/clear_all_data", json={}, timeout=30)
+                    response = SESSION.post("http://localhost:8005/rest/clear_all_data", json={"request_id": uuid.uuid4().hex}, timeout=30)
+                    CACHE.invalidate()
                     data = response.json()
                     st.write("🔍 Full Response:", data)
                     if response.status_code == 200 and data["status"] == "success":
+                        forget_uploads()
                         st.success("✅ All documents and embeddings deleted successfully!")
                     else:
                         st.error(f"❌ Failed to delete data: {data.get('message')}")
@@ -64,6 +297,23 @@ def upload_page():
                     st.error(f"🚨 Error decoding response: {e}")
                     st.write("⚠️ Raw Response Text:", response.text)
 
+# === Read a streamed answer from the query agent ===
+def stream_answer(body):
+    with SESSION.post(QUERY_STREAM_URL, json=body, stream=True, timeout=(5, 300)) as response:
+        response.raise_for_status()
+        placeholder = st.empty()
+        answer = ""
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            if event.get("done"):
+                break
+            answer += event.get("token", "")
+            placeholder.success(f"🤖 AI Response: {answer}")
+        if not answer:
+            placeholder.warning("⚠ The assistant returned an empty answer.")
+
 def assistant_page():
     st.subheader("💬 AI Assistant")
 
@@ -74,23 +324,33 @@ def assistant_page():
 
     if submit_button and user_query:
         st.write(f"🗨 *You asked:* {user_query}")
+        request_id = uuid.uuid4().hex
 
-        # Step 1: Ask embedding agent to retrieve the closest document
-        response = requests.post(
+        # Step 1: Ask embedding agent for the most relevant transaction chunks
+        response = SESSION.post(
             "http://localhost:8002/rest/retrieve_closest",
-            json={"query": user_query},
+            json={"query": user_query, "top_k": 8, "request_id": request_id},
         )
 
         if response.status_code == 200:
-            path = response.json().get('path')
-            if not path:
+            chunks = response.json().get('chunks') or []
+            if not chunks:
                 st.warning("⚠ No relevant document found.")
                 return
 
-            # Step 2: Ask query agent to extract answer from the retrieved document
-            query_response = requests.post(
+            # Step 2: Ask query agent to answer from the retrieved chunks only,
+            # rendering the answer as it is generated
+            body = {"query": user_query, "chunks": chunks, "request_id": request_id}
+            try:
+                stream_answer(body)
+                return
+            except requests.exceptions.RequestException:
+                pass
+
+            # Streaming endpoint unavailable: wait for the whole answer instead
+            query_response = SESSION.post(
                 "http://localhost:8001/rest/process_query",
-                json={"query": user_query, "path": path},
+                json=body,
             )
 
             if query_response.status_code == 200:
@@ -105,12 +365,11 @@ def assistant_page():
 # === Helper to Get List of Files from MongoDB ===
 def get_uploaded_files():
     try:
-        response = requests.post("http://localhost:8002/rest/list_files", json={})
-        if response.status_code == 200:
-            return response.json().get("files", [])
-        else:
-            st.error(f"Failed to fetch uploaded files. Status: {response.status_code}")
-            return []
+        data = cached_post("http://localhost:8002/rest/list_files", {"request_id": uuid.uuid4().hex}, ("list_files",))
+        return data.get("files", [])
+    except BackendError as e:
+        st.error(f"Failed to fetch uploaded files. Error: {e}")
+        return []
     except Exception as e:
         st.error(f"Error connecting to backend: {e}")
         return []
@@ -129,15 +388,16 @@ def charts_page():
         if submit_button and user_query:
             st.write(f"🗨️ *You asked:* {user_query}")
             st.write("🔎 Generating chart...")
+            request_id = uuid.uuid4().hex
 
-            response = requests.post(
+            response = SESSION.post(
                 "http://localhost:8002/rest/retrieve_closest",
-                json={"query": user_query},
+                json={"query": user_query, "request_id": request_id},
             )
 
             if response.status_code == 200:
                 path = response.json().get('path')  # e.g., 'abcd.txt'
-                fetch_and_plot_chart(user_query, path, "📈 Generated Chart")
+                fetch_and_plot_chart(user_query, path, "📈 Generated Chart", request_id)
             else:
                 st.error(f"❗ Failed to retrieve document path. Error: {response.text}")
     else:
@@ -145,49 +405,73 @@ def charts_page():
 
 
 # === Chart Generator ===
-def fetch_and_plot_chart(prompt, path, title):
-    query_response = requests.post(
-        "http://localhost:8003/rest/plot_chart",
-        json={"query": prompt, "path": path},
-    )
-    if query_response.status_code == 200:
-        answer = query_response.json().get('answer')
+def fetch_and_plot_chart(prompt, path, title, request_id=""):
+    try:
+        data = cached_post(
+            "http://localhost:8003/rest/plot_chart",
+            {"query": prompt, "path": path, "request_id": request_id},
+            ("plot_chart", prompt, path),
+            ok=lambda data: bool(data.get("figure")),
+        )
+    except Exception as e:
+        st.error(f"❗ Failed to plot the chart. Error: {e}")
+        return
+    answer = data.get('answer')
+    figure = data.get('figure')
 
-        # 🔍 Show raw code
+    # 🔍 Show raw code
+    if answer:
         st.code(answer, language="python")
 
-        # 🧼 Clean code
-        answer = re.sub(r"^```python\s*", "", answer)
-        answer = re.sub(r"\s*```$", "", answer)
-
-        if "fig" not in answer:
-            answer += "\nfig"
+    # The chart agent runs the code in its sandbox and returns the figure
+    if figure:
+        st.title(title)
+        st.plotly_chart(pio.from_json(figure), use_container_width=True)
+    else:
+        st.error(f"🚨 {data.get('text')}")
+
+# === Native Chart (computed by the chart agent, no LLM involved) ===
+def fetch_native_chart(kind, path, request_id=""):
+    # Runs on the fan-out pool: no Streamlit calls here
+    return cached_post(
+        "http://localhost:8003/rest/native_chart",
+        {"kind": kind, "path": path, "request_id": request_id},
+        ("native_chart", kind, path),
+        ok=lambda data: bool(data.get("figure")),
+    )
 
-        local_vars = {}
-        try:
-            exec(answer, {"datetime": datetime, "px": px}, local_vars)
-            fig = local_vars.get("fig")
-            if fig:
-                st.title(title)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.error("⚠️ No figure was found in the executed code.")
-        except Exception as e:
-            st.error(f"🚨 Failed to execute chart code: {e}")
+def plot_native_chart(future, title):
+    try:
+        data = future.result()
+    except Exception as e:
+        st.error(f"❗ Failed to plot the chart. Error: {e}")
+        return
+    figure = data.get('figure')
+    if figure:
+        st.title(title)
+        st.plotly_chart(pio.from_json(figure), use_container_width=True)
     else:
-        st.error(f"❗ Failed to plot the chart. Error: {query_response.text}")
+        st.error(f"❗ Failed to plot the chart. Error: {data.get('text')}")
 
 # === Track Insights Page ===
+TRACK_CHARTS = [
+    ("balance_trend", "📈 Trend of Balance in Your Account"),
+    ("credit_debit", "📊 Categorized Expenses"),
+    ("expense_income", "🥧 Expense Distribution"),
+]
+
 def track_page():
     st.subheader("📊 Track Insights")
     uploaded_files = get_uploaded_files()
 
     if uploaded_files:
         selected_file = st.selectbox("Select a file to view insights:", uploaded_files)
+        request_id = uuid.uuid4().hex
 
-        fetch_and_plot_chart("Generate a line plot showing trend of Balance.", selected_file, "📈 Trend of Balance in Your Account")
-        fetch_and_plot_chart("Generate a bar plot showing distribution of credit and debit.", selected_file, "📊 Categorized Expenses")
-        fetch_and_plot_chart("Generate a pie chart showing distribution of expenses and income.", selected_file, "🥧 Expense Distribution")
+        # Fetch all charts at once, then draw them in order
+        futures = [(POOL.submit(fetch_native_chart, kind, selected_file, request_id), title) for kind, title in TRACK_CHARTS]
+        for future, title in futures:
+            plot_native_chart(future, title)
     else:
         st.warning("⚠️ Please upload at least one PDF before trying to track insights.")
 
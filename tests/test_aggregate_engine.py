@@ -0,0 +1,130 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from aggregate_engine import answer_query, classify_query
+
+def make_df(rows):
+    return pd.DataFrame(rows, columns=["date", "description", "debit", "credit", "balance"])
+
+@pytest.fixture
+def df():
+    return make_df([
+        (datetime(2024, 1, 5), "SWIGGY ORDER", 250.0, 0.0, 9750.0),
+        (datetime(2024, 1, 20), "SALARY JAN", 0.0, 50000.0, 59750.0),
+        (datetime(2024, 2, 3), "AMAZON PAY", 1200.0, 0.0, 58550.0),
+        (datetime(2024, 2, 10), "SWIGGY ORDER", 450.0, 0.0, 58100.0),
+        (datetime(2024, 2, 28), "CREDIT CARD PAYMENT", 8000.0, 0.0, 50100.0),
+    ])
+
+@pytest.mark.parametrize("question, kind", [
+    ("How much did I spend in total?", "total_spend"),
+    ("What is my total income?", "total_income"),
+    ("How much was credited to my account?", "total_income"),
+    ("Total salary received last month", "total_income"),
+    ("Show my top 3 transactions", "top_debits"),
+    ("Spending by merchant", "spend_by_description"),
+    ("Where did I spend my money?", "spend_by_description"),
+    ("What was my average balance?", "average_balance"),
+])
+def test_classify_query_kinds(question, kind):
+    assert classify_query(question)["kind"] == kind
+
+def test_classify_query_credit_card_is_not_income():
+    assert classify_query("What is the total of my credit card bill?") is None
+
+def test_classify_query_unknown_question():
+    assert classify_query("Why was my account frozen?") is None
+
+def test_classify_query_top_n_and_period():
+    intent = classify_query("Top 3 purchases last month")
+    assert intent["n"] == 3
+    assert intent["period"] == ("relative_month", -1)
+
+def test_classify_query_merchant_and_month():
+    intent = classify_query("How much did I spend on swiggy in january 2024?")
+    assert intent["merchant"] == "swiggy"
+    assert intent["period"] == ("month", 1, 2024)
+
+def test_classify_query_ignores_period_as_merchant():
+    intent = classify_query("How much did I spend over the last 30 days?")
+    assert intent["merchant"] is None
+    assert intent["period"] == ("last_n", 30, "day")
+
+def test_answer_total_spend(df):
+    answer = answer_query(classify_query("How much did I spend in total?"), df)
+    assert "Rs 9,900.00" in answer
+    assert "4 debit transaction(s)" in answer
+
+def test_answer_total_income(df):
+    answer = answer_query(classify_query("What is my total income?"), df)
+    assert "Rs 50,000.00" in answer
+
+def test_answer_merchant_filter(df):
+    answer = answer_query(classify_query("How much did I spend on swiggy?"), df)
+    assert "Rs 700.00" in answer
+    assert "'swiggy'" in answer
+
+def test_answer_unmatched_merchant_falls_back(df):
+    assert answer_query(classify_query("How much did I spend on food?"), df) is None
+
+def test_answer_relative_month_is_anchored_on_data(df):
+    # The latest transaction is in February, so "last month" is January 2024
+    answer = answer_query(classify_query("How much did I spend last month?"), df)
+    assert "January 2024" in answer
+    assert "Rs 250.00" in answer
+
+def test_answer_empty_period(df):
+    answer = answer_query(classify_query("How much did I spend in june 2023?"), df)
+    assert answer == "There are no transactions in June 2023."
+
+def test_answer_top_debits(df):
+    answer = answer_query(classify_query("Top 2 transactions"), df)
+    lines = answer.splitlines()
+    assert len(lines) == 3
+    assert "CREDIT CARD PAYMENT" in lines[1]
+    assert "AMAZON PAY" in lines[2]
+
+def test_answer_spend_by_description(df):
+    answer = answer_query(classify_query("Spending by merchant"), df)
+    assert "- SWIGGY ORDER: Rs 700.00 (2 transaction(s))" in answer
+
+def test_answer_average_balance(df):
+    answer = answer_query(classify_query("What was my average balance in february?"), df)
+    assert "February 2024" in answer
+    assert "Rs 55,583.33" in answer
+
+def test_answer_ignores_undated_rows():
+    df = make_df([(None, "UNKNOWN", 10.0, 0.0, 0.0)])
+    assert answer_query(classify_query("How much did I spend in total?"), df) is None
+
+def test_classify_query_year():
+    intent = classify_query("How much did I spend in 2023?")
+    assert intent["period"] == ("year", 2023)
+    assert intent["merchant"] is None
+
+def test_classify_query_this_week():
+    assert classify_query("How much did I spend this week?")["period"] == ("this_week",)
+
+@pytest.mark.parametrize("question", [
+    "How much did I spend yesterday?",
+    "How much did I spend last quarter?",
+    "How much did I spend between jan and mar?",
+    "How much did I spend since 01/02?",
+    "How much did I spend each month?",
+    "How much did I spend in january and february?",
+])
+def test_classify_query_unparsed_time_falls_back(question):
+    assert classify_query(question) is None
+
+def test_answer_year(df):
+    answer = answer_query(classify_query("How much did I spend in 2024?"), df)
+    assert "in 2024" in answer
+    assert "Rs 9,900.00" in answer
+
+def test_answer_this_week(df):
+    # The latest transaction is Wednesday 28-Feb-2024, so the week starts on the 26th
+    answer = answer_query(classify_query("How much did I spend this week?"), df)
+    assert "the week of 26 February 2024" in answer
+    assert "Rs 8,000.00" in answer